@@ -0,0 +1,195 @@
+"""
+Sentetik doküman üretici - Benchmark ve değerlendirme için tekrarlanabilir PDF/DOCX korpusu
+
+Bu modül şu görevleri yerine getirir:
+- Sabit tohumla (seed) aynı içeriği üreten PDF ve DOCX dosyaları yazar (ek bağımlılık gerektirmez)
+- Her sayfaya benzersiz kodlu bir "olgu" cümlesi yerleştirir ve bunun için soru üretir (probe)
+- Dokümanlar arasında tekrar eden standart metinler (uyarı/başlık) ekler (dedup senaryosu)
+- Korpus özetini ve soruları (kaynak dosya/sayfa ve beklenen cevapla) döndürür
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import random
+import textwrap
+import zipfile
+from xml.sax.saxutils import escape
+
+# PDF standart fontu (Helvetica / WinAnsi) ğ, ş, ı karakterlerini içermez: metin ASCII'dir
+TOPICS = [
+    "izin", "mesai", "seyahat", "egitim", "prim", "saglik sigortasi", "uzaktan calisma",
+    "ekipman", "bilgi guvenligi", "satin alma", "performans", "ise alim",
+]
+ATTRIBUTES = [
+    ("yillik limit", "gun"), ("onay suresi", "is gunu"), ("ust sinir", "TL"),
+    ("bildirim suresi", "gun"), ("asgari kidem", "ay"), ("katki orani", "yuzde"),
+]
+WORDS = (
+    "calisan yonetici birim politika surec kayit talep onay belge kapsam uygulama sorumlu "
+    "donem hesap tutar kural istisna bildirim sistem form basvuru denetim rapor hedef "
+    "kurum departman sozlesme madde hak yukumluluk gecerli tarih itiraz degerlendirme"
+).split()
+BOILERPLATE = [
+    "Bu dokuman sirket ici kullanim icindir ve izinsiz paylasilamaz. Guncel surum icin insan "
+    "kaynaklari portalini kontrol ediniz. Celiski durumunda yururlukteki mevzuat esas alinir.",
+    "Sorulariniz icin ilgili birim yoneticinize veya politika sahibine basvurunuz. Bu politika "
+    "yillik olarak gozden gecirilir ve degisiklikler tum calisanlara duyurulur.",
+]
+QUESTION_TEMPLATES = [
+    "{code} numarali {topic} politikasinda {attribute} nedir?",
+    "{topic} politikasi {code} icin {attribute} ne kadar?",
+    "{code} kapsaminda {attribute} kac {unit}?",
+]
+LINE_WIDTH = 95
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: Path, pages: List[List[str]]) -> None:
+    """
+    Her sayfası satır listesi olan minimal (metin çıkarılabilir) bir PDF yazar.
+
+    """
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            "<< /Type /Pages /Kids [" + " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+            + f"] /Count {len(pages)} >>"
+        ).encode("ascii"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, lines in enumerate(pages):
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode("ascii"))
+        ops = ["BT", "/F1 9 Tf", "12 TL", "40 800 Td"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    out += "".join(f"{off:010d} 00000 n \n" for off in offsets).encode("ascii")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    path.write_bytes(bytes(out))
+
+def write_docx(path: Path, paragraphs: List[str]) -> None:
+    """
+    Sadece word/document.xml içeren minimal bir DOCX yazar (docx2txt ile okunabilir).
+
+    """
+    body = "".join(f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", content_types)
+        z.writestr("_rels/.rels", rels)
+        z.writestr("word/document.xml", document)
+
+def _page_paragraphs(rng: random.Random, doc_idx: int, page: int, paragraphs: int) -> Dict[str, Any]:
+    topic = rng.choice(TOPICS)
+    attribute, unit = rng.choice(ATTRIBUTES)
+    code = f"POL-{doc_idx:04d}-{page + 1}"
+    value = rng.randint(2, 90)
+    fact = f"{code} numarali {topic} politikasina gore {attribute} {value} {unit} olarak belirlenmistir."
+    body = [_paragraph(rng) for _ in range(paragraphs)]
+    body.insert(rng.randint(0, len(body)), fact)
+    if page == 0:
+        body.insert(0, f"Dokuman {doc_idx}: {topic.title()} Politikasi. " + BOILERPLATE[doc_idx % len(BOILERPLATE)])
+    return {
+        "paragraphs": body,
+        "probe": {
+            "code": code, "topic": topic, "attribute": attribute, "unit": unit,
+            "answer": f"{value} {unit}", "page": page,
+        },
+    }
+
+def generate_corpus(
+    out_dir: Path,
+    docs: int = 20,
+    pages: int = 3,
+    paragraphs: int = 4,
+    pdf_ratio: float = 0.5,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    out_dir altına `docs` adet PDF/DOCX dosyası üretir.
+
+    Returns:
+        {"files", "pages", "bytes", "probes": [{"question", "source", "page", "answer", ...}]}
+        (DOCX sayfaları tek doküman olarak yüklendiği için page=None)
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    probes: List[Dict[str, Any]] = []
+    files: List[str] = []
+    n_pdf = round(docs * pdf_ratio)
+    total_pages = 0
+    for i in range(docs):
+        is_pdf = i < n_pdf
+        path = out_dir / f"doc_{i:04d}.{'pdf' if is_pdf else 'docx'}"
+        page_data = [_page_paragraphs(rng, i, p, paragraphs) for p in range(pages)]
+        if is_pdf:
+            pdf_pages = []
+            for pd in page_data:
+                lines: List[str] = []
+                for para in pd["paragraphs"]:
+                    lines += textwrap.wrap(para, LINE_WIDTH, break_on_hyphens=False) + [""]
+                pdf_pages.append(lines)
+            write_pdf(path, pdf_pages)
+        else:
+            write_docx(path, [para for pd in page_data for para in pd["paragraphs"]])
+        total_pages += pages
+        files.append(str(path))
+        for pd in page_data:
+            probe = pd["probe"]
+            page: Optional[int] = probe["page"] if is_pdf else None
+            for t, template in enumerate(QUESTION_TEMPLATES):
+                probes.append({
+                    "question": template.format(**probe),
+                    "variant": t,
+                    "source": str(path),
+                    "page": page,
+                    "code": probe["code"],
+                    "answer": probe["answer"],
+                })
+    corpus = {
+        "files": files,
+        "pages": total_pages,
+        "bytes": sum(Path(f).stat().st_size for f in files),
+        "seed": seed,
+        "probes": probes,
+    }
+    return corpus
@@ -0,0 +1,285 @@
+"""
+Retrieval değerlendirme modülü - Kalite / maliyet karşılaştırmalı ayar taraması
+
+Bu modül şu görevleri yerine getirir:
+- Etiketli soru -> ilgili kaynak (dosya, sayfa) kümesini okur ya da sentetik korpustan üretir
+- CHUNK_SIZE değerlerinin her biri için ayrı bir süreçte (config ortamdan okunduğu için) indeks kurar
+- Her indekste SEARCH_TYPE, TOP_K, fetch_k ve MMR_LAMBDA kombinasyonlarını tarar
+- Her ayar için recall@k, MRR, isabet oranı, retrieval gecikmesi ve prompt token sayısını raporlar
+- Kalite hedefini (recall / MRR) karşılayan en ucuz ayarı (önce prompt token, sonra gecikme) seçer
+
+Etiket dosyası (JSONL, satır başına bir soru):
+    {"question": "...", "relevant": [{"source": "izin.pdf", "page": 2}, {"source": "el_kitabi.docx"}]}
+"page" verilmezse (veya DOCX ise) dosyanın herhangi bir chunk'ı ilgili sayılır; kaynaklar dosya
+adıyla eşleştirilir. --labels verilmezse sentetik korpus ve soruları kullanılır.
+
+Çalıştırma (proje kökünden):
+    python benchmarks/evaluate.py --labels sorular.jsonl --docs-dir storage/uploads --target-recall 0.9
+    EMBEDDING_MODEL_NAME=fake python benchmarks/evaluate.py --offline --chunk-sizes 500,1500
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from itertools import product
+from pathlib import Path
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from run_benchmarks import ROOT, SEARCH_TYPES, latency_stats, prepare_env
+
+ALLOWED_EXTS = {".pdf", ".docx"}
+
+_WARMUP_QUERY = "ısınma sorgusu"
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+def load_labels(path: Path) -> List[Dict[str, Any]]:
+    """
+    JSONL etiket dosyasını okur; "relevant" yerine düz "sources" listesi de kabul edilir.
+
+    """
+    labels = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        relevant = row.get("relevant") or [{"source": s} for s in row.get("sources", [])]
+        if not row.get("question") or not relevant:
+            continue
+        labels.append({
+            "question": row["question"],
+            "relevant": [{"source": Path(r["source"]).name, "page": r.get("page")} for r in relevant],
+        })
+    return labels
+
+def labels_from_corpus(probes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"question": p["question"], "relevant": [{"source": Path(p["source"]).name, "page": p["page"]}]}
+        for p in probes
+    ]
+
+def _relevant_hits(meta: Dict[str, Any], relevant: List[Dict[str, Any]]) -> List[int]:
+    """
+    Chunk'ın (tekilleştirilmişse tüm referanslarıyla) karşıladığı ilgili kaynakların indeksleri.
+
+    """
+    from dedup import parse_refs
+
+    refs = [(Path(src).name, page) for src, page in parse_refs(meta)]
+    return [
+        i for i, r in enumerate(relevant)
+        if any(src == r["source"] and (r["page"] is None or page == r["page"]) for src, page in refs)
+    ]
+
+def score(docs, relevant: List[Dict[str, Any]]) -> Tuple[float, float]:
+    """
+    Tek soru için (recall, reciprocal rank) döndürür.
+
+    """
+    found, rr = set(), 0.0
+    for rank, d in enumerate(docs, 1):
+        hits = _relevant_hits(d.metadata or {}, relevant)
+        if hits and not rr:
+            rr = 1.0 / rank
+        found.update(hits)
+    return len(found) / len(relevant), rr
+
+def _grid(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Arama tipine göre anlamlı parametre kombinasyonları (similarity fetch_k / lambda kullanmaz).
+
+    """
+    grid = []
+    for search_type in args["search_types"]:
+        fetch_ks = args["fetch_k"] if search_type in ("mmr", "hybrid") else [None]
+        lambdas = args["mmr_lambda"] if search_type == "mmr" else [None]
+        for top_k, fetch_k, mmr_lambda in product(args["top_k"], fetch_ks, lambdas):
+            if fetch_k is not None and fetch_k < top_k:
+                continue
+            grid.append({"search_type": search_type, "top_k": top_k, "fetch_k": fetch_k, "mmr_lambda": mmr_lambda})
+    return grid
+
+def run_worker(job_file: Path) -> None:
+    """
+    Tek CHUNK_SIZE için: dosyaları indeksler, tüm retriever ayarlarını değerlendirir
+    ve satırları job["out"] dosyasına yazar. Sorgu embedding önbelleği kapalıdır
+    (prepare_env); her ayar soruları yeniden embed eder, gecikmeler ayarlar arasında
+    karşılaştırılabilir kalır.
+
+    """
+    job = json.loads(job_file.read_text(encoding="utf-8"))
+    prepare_env(Path(job["workdir"]), offline=job["offline"])
+
+    import config
+    from history import count_tokens
+    from ingest import get_vectorstore, index_files
+    from rag_chain import build_retriever, get_prompt_template, pack_context
+
+    stats = index_files([Path(f) for f in job["files"]])
+    vs = get_vectorstore()
+    labels = job["labels"]
+    prompt = get_prompt_template(is_short=True)
+    rows = []
+    for params in _grid(job["grid"]):
+        retriever = build_retriever(
+            vs, search_type=params["search_type"], top_k=params["top_k"],
+            mmr_lambda=params["mmr_lambda"] if params["mmr_lambda"] is not None else config.MMR_LAMBDA,
+            fetch_k=params["fetch_k"], cache=False,
+        )
+        retriever.invoke(_WARMUP_QUERY)  # Isınma (model / BM25 yükleme); ölçülen sorulardan biri değil
+        recalls, packed_recalls, rrs, samples, context_tokens, prompt_tokens = [], [], [], [], [], []
+        for label in labels:
+            t0 = time.perf_counter()
+            docs = retriever.invoke(label["question"])
+            samples.append(time.perf_counter() - t0)
+            recall, rr = score(docs, label["relevant"])
+            context, used_docs, info = pack_context(docs)
+            recalls.append(recall)
+            rrs.append(rr)
+            packed_recalls.append(score(used_docs, label["relevant"])[0])
+            context_tokens.append(info["context_tokens"])
+            prompt_tokens.append(count_tokens(prompt.format_messages(question=label["question"], context=context)))
+        n = len(labels)
+        rows.append({
+            "embedding_model": config.EMBEDDING_MODEL_NAME,
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+            **params,
+            "recall": round(sum(recalls) / n, 4),
+            "packed_recall": round(sum(packed_recalls) / n, 4),
+            "mrr": round(sum(rrs) / n, 4),
+            "hit_rate": round(sum(1 for r in rrs if r) / n, 4),
+            "latency": latency_stats(samples),
+            "context_tokens": round(sum(context_tokens) / n, 1),
+            "prompt_tokens": round(sum(prompt_tokens) / n, 1),
+            "index_chunks": stats["chunks"],
+        })
+        print(f"  chunk={config.CHUNK_SIZE} {params} recall={rows[-1]['recall']} mrr={rows[-1]['mrr']}", flush=True)
+    Path(job["out"]).write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+
+def pick_cheapest(rows: List[Dict[str, Any]], target_recall: float, target_mrr: float) -> Optional[Dict[str, Any]]:
+    """
+    Hedefi karşılayan ayarlar arasından en az prompt token'lı (eşitlikte en hızlı) olanı seçer.
+
+    """
+    ok = [r for r in rows if r["recall"] >= target_recall and r["mrr"] >= target_mrr]
+    return min(ok, key=lambda r: (r["prompt_tokens"], r["latency"]["p50_ms"]), default=None)
+
+def _describe(row: Dict[str, Any]) -> str:
+    parts = [f"CHUNK_SIZE={row['chunk_size']}", f"SEARCH_TYPE={row['search_type']}", f"TOP_K={row['top_k']}"]
+    if row["fetch_k"] is not None:
+        parts.append(f"{'MMR_FETCH_K' if row['search_type'] == 'mmr' else 'HYBRID_FETCH_K'}={row['fetch_k']}")
+    if row["mmr_lambda"] is not None:
+        parts.append(f"MMR_LAMBDA={row['mmr_lambda']}")
+    return " ".join(parts)
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="DocuBrain retrieval kalite / maliyet taraması")
+    parser.add_argument("--labels", type=Path, default=None, help="JSONL etiket dosyası")
+    parser.add_argument("--docs-dir", type=Path, default=None, help="Etiketlerdeki dokümanların dizini")
+    parser.add_argument("--docs", type=int, default=20, help="Sentetik korpus: doküman sayısı")
+    parser.add_argument("--pages", type=int, default=3, help="Sentetik korpus: doküman başına sayfa")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-questions", type=int, default=200)
+    parser.add_argument("--chunk-sizes", type=_ints, default=[500, 1000, 1500])
+    parser.add_argument("--overlap-ratio", type=float, default=0.2, help="CHUNK_OVERLAP = oran * CHUNK_SIZE")
+    parser.add_argument("--search-types", type=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+                        default=list(SEARCH_TYPES))
+    parser.add_argument("--top-k", type=_ints, default=[3, 5, 8])
+    parser.add_argument("--fetch-k", type=_ints, default=[20, 50])
+    parser.add_argument("--mmr-lambda", type=_floats, default=[0.3, 0.6, 0.9])
+    parser.add_argument("--target-recall", type=float, default=0.9)
+    parser.add_argument("--target-mrr", type=float, default=0.0)
+    parser.add_argument("--offline", action="store_true", help="Ortamda verilmedikçe sahte embedding kullan")
+    parser.add_argument("--workdir", type=Path, default=None, help="Varsayılan: geçici dizin (sonda silinir)")
+    parser.add_argument("--out", type=Path, default=None, help="Varsayılan: benchmarks/results/eval-<zaman>.json")
+    parser.add_argument("--job", type=Path, default=None, help=argparse.SUPPRESS)  # Alt süreç
+    args = parser.parse_args(argv)
+
+    if args.job:
+        run_worker(args.job)
+        return {}
+    if args.labels and not args.docs_dir:
+        parser.error("--labels ile birlikte --docs-dir verilmelidir")
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="docubrain-eval-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    if args.labels:
+        labels = load_labels(args.labels)
+        files = sorted(str(p) for p in args.docs_dir.iterdir() if p.suffix.lower() in ALLOWED_EXTS)
+    else:
+        from corpus import generate_corpus
+
+        corpus = generate_corpus(workdir / "corpus", docs=args.docs, pages=args.pages, seed=args.seed)
+        labels, files = labels_from_corpus(corpus["probes"]), corpus["files"]
+    labels = labels[: args.max_questions]
+    if not labels or not files:
+        parser.error("Değerlendirilecek soru veya doküman bulunamadı")
+
+    grid = {"search_types": args.search_types, "top_k": args.top_k, "fetch_k": args.fetch_k, "mmr_lambda": args.mmr_lambda}
+    rows: List[Dict[str, Any]] = []
+    try:
+        for chunk_size in args.chunk_sizes:
+            run_dir = workdir / f"chunk-{chunk_size}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            job = {
+                "workdir": str(run_dir), "offline": args.offline, "files": files,
+                "labels": labels, "grid": grid, "out": str(run_dir / "rows.json"),
+            }
+            job_file = run_dir / "job.json"
+            job_file.write_text(json.dumps(job, ensure_ascii=False), encoding="utf-8")
+            env = {
+                **os.environ,
+                "CHUNK_SIZE": str(chunk_size),
+                "CHUNK_OVERLAP": str(int(chunk_size * args.overlap_ratio)),
+            }
+            print(f"[chunk_size={chunk_size}] {len(files)} dosya, {len(labels)} soru ...", flush=True)
+            proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--job", str(job_file)], env=env)
+            if proc.returncode != 0:
+                print(f"[chunk_size={chunk_size}] başarısız (çıkış kodu {proc.returncode})", file=sys.stderr)
+                continue
+            rows.extend(json.loads((run_dir / "rows.json").read_text(encoding="utf-8")))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    best = pick_cheapest(rows, args.target_recall, args.target_mrr)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "questions": len(labels),
+            "files": len(files),
+            "labels": str(args.labels) if args.labels else "synthetic",
+            "embedding_model": rows[0]["embedding_model"] if rows else None,
+            "target": {"recall": args.target_recall, "mrr": args.target_mrr},
+        },
+        "best": best,
+        "rows": rows,
+    }
+    out = args.out or ROOT / "benchmarks" / "results" / f"eval-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\n{'ayar':<78} {'recall':>7} {'packed':>7} {'mrr':>6} {'p50 ms':>8} {'prompt tok':>10}")
+    for r in sorted(rows, key=lambda r: (-r["recall"], r["prompt_tokens"])):
+        mark = "*" if r is best else " "
+        print(f"{mark}{_describe(r):<77} {r['recall']:>7.3f} {r['packed_recall']:>7.3f} {r['mrr']:>6.3f} "
+              f"{r['latency']['p50_ms']:>8.2f} {r['prompt_tokens']:>10.0f}")
+    if best:
+        print(f"\nHedefi (recall >= {args.target_recall}, MRR >= {args.target_mrr}) karşılayan en ucuz ayar:\n  {_describe(best)}")
+    else:
+        print(f"\nHiçbir ayar hedefi (recall >= {args.target_recall}, MRR >= {args.target_mrr}) karşılamadı.")
+    print(f"Sonuç: {out}")
+    return results
+
+if __name__ == "__main__":
+    main()
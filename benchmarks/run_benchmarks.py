@@ -0,0 +1,311 @@
+"""
+Benchmark modülü - Ağ gerektirmeyen ingest ve sorgu performans ölçümü
+
+Bu modül şu görevleri yerine getirir:
+- Sentetik PDF/DOCX korpusu üretir (corpus.py) ve geçici bir storage dizininde çalışır
+- index_files için yükleme/bölme/embed süreleri, doküman/s, chunk/s ve tepe RSS ölçer
+- build_retriever varyantları (similarity / mmr / hybrid) için p50/p95/p99 gecikme ölçer
+- Sahte (deterministik) LLM ile uçtan uca answer_with_chain gecikmesi ve ilk token süresini ölçer
+- Sonuçları karşılaştırılabilir JSON olarak yazar; --baseline ile önceki çalıştırmaya göre farkı gösterir
+
+Çalıştırma (proje kökünden):
+    python benchmarks/run_benchmarks.py --docs 50 --pages 4 --out benchmarks/results/base.json
+    CHUNK_SIZE=800 python benchmarks/run_benchmarks.py --docs 50 --pages 4 --baseline benchmarks/results/base.json
+
+Varsayılan olarak EMBEDDING_MODEL_NAME=fake-384 ve LLM_PROVIDER=fake kullanılır; gerçek
+bir modeli ölçmek için bu değişkenler ortamdan verilebilir.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+SEARCH_TYPES = ("similarity", "mmr", "hybrid")
+
+def prepare_env(workdir: Path, offline: bool = True) -> None:
+    """
+    src modülleri import edilmeden önce tüm storage yollarını geçici dizine yönlendirir.
+    Önbellekler soğuk başlar; cevap önbelleği tekrar eden soruları ölçümden düşürmesin diye kapalıdır.
+    Sorgu embedding önbelleği ve batching penceresi de kapalıdır: ısınmada ya da önceki arama tipinde
+    embed edilen sorular sonraki ölçümlerde embed maliyetini atlamaz.
+    offline=True ise ortamda verilmedikçe sahte embedding modeli ve LLM kullanılır.
+
+    """
+    os.environ["PERSIST_DIRECTORY"] = str(workdir / "chroma_db")
+    os.environ["UPLOAD_DIRECTORY"] = str(workdir / "uploads")
+    os.environ["EMBEDDING_CACHE_DIR"] = str(workdir / "embedding_cache")
+    os.environ["ANSWER_CACHE_FILE"] = str(workdir / "answer_cache.sqlite")
+    os.environ["CHAT_HISTORY_DIR"] = str(workdir / "chat_history")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["QUERY_EMBEDDING_CACHE_SIZE"] = "0"
+    os.environ["QUERY_BATCH_WINDOW_MS"] = "0"
+    os.environ["TRACING_ENABLED"] = "true"
+    os.environ.pop("TRACE_LOG_FILE", None)
+    if offline:
+        os.environ.setdefault("EMBEDDING_MODEL_NAME", "fake-384")
+        os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    sys.path.insert(0, str(SRC))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+def _peak_rss_mb() -> Dict[str, Optional[float]]:
+    """
+    Sürecin ve (ingest worker'ları gibi) alt süreçlerin tepe RSS değeri (MB).
+
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {"self": None, "children": None}
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS bayt, Linux KB
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+def latency_stats(samples: List[float]) -> Dict[str, Any]:
+    """
+    Saniye cinsinden örneklerin ms olarak ortalama ve p50/p95/p99 değerleri.
+
+    """
+    import numpy as np
+
+    if not samples:
+        return {"n": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def _stage_seconds(prefixes: tuple) -> Dict[str, Dict[str, Any]]:
+    from tracing import snapshot
+
+    stages = snapshot().get("seconds", {})
+    return {
+        name: {"count": s["count"], "total_s": round(s["sum"], 4), "p50_ms": round(s["p50"] * 1000, 3)}
+        for name, s in stages.items() if name.startswith(prefixes)
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def bench_ingest(files: List[Path], n_pages: int) -> Dict[str, Any]:
+    """
+    Korpusu sıfırdan indeksler; toplam süre, throughput ve aşama sürelerini döndürür.
+
+    """
+    import tracing
+    from ingest import index_files
+
+    tracing.reset()
+    t0 = time.perf_counter()
+    stats = index_files(files)
+    elapsed = time.perf_counter() - t0
+    return {
+        "seconds": round(elapsed, 3),
+        "docs_per_s": round(len(files) / elapsed, 2),
+        "pages_per_s": round(n_pages / elapsed, 2),
+        "chunks_per_s": round(stats["chunks"] / elapsed, 2),
+        "stats": {k: v for k, v in stats.items() if k != "errors"},
+        "errors": len(stats["errors"]),
+        "stages": _stage_seconds(("ingest.", "embed.")),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def bench_retrieval(questions: List[str], search_types, top_k: int, warmup: int) -> Dict[str, Any]:
+    """
+    Her arama tipi için retriever'ı önbelleksiz kurar ve soru başına gecikmeyi ölçer.
+
+    """
+    from ingest import get_vectorstore
+    from rag_chain import build_retriever
+
+    vs = get_vectorstore()
+    out: Dict[str, Any] = {}
+    for search_type in search_types:
+        retriever = build_retriever(vs, search_type=search_type, top_k=top_k, cache=False)
+        for q in questions[:warmup]:
+            retriever.invoke(q)
+        samples, n_docs = [], 0
+        for q in questions:
+            t0 = time.perf_counter()
+            docs = retriever.invoke(q)
+            samples.append(time.perf_counter() - t0)
+            n_docs += len(docs)
+        out[search_type] = {**latency_stats(samples), "avg_docs": round(n_docs / max(1, len(questions)), 2)}
+    return out
+
+def bench_e2e(questions: List[str], top_k: int) -> Dict[str, Any]:
+    """
+    stream_answer_with_chain ile uçtan uca gecikme, ilk token süresi ve token sayıları.
+
+    """
+    import tracing
+    from config import DEFAULT_OPENAI_MODEL, SEARCH_TYPE
+    from ingest import get_vectorstore
+    from llm_clients import create_llm
+    from rag_chain import build_retriever, stream_answer_with_chain
+
+    llm = create_llm(DEFAULT_OPENAI_MODEL, temperature=0.0)
+    retriever = build_retriever(get_vectorstore(), search_type=SEARCH_TYPE, top_k=top_k, cache=False)
+    tracing.reset()
+    total, first_token = [], []
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0, "context_tokens": 0, "context_tokens_saved": 0}
+    for q in questions:
+        t0 = time.perf_counter()
+        ttft = None
+        for event in stream_answer_with_chain(llm, retriever, q):
+            if event["type"] == "token" and ttft is None:
+                ttft = time.perf_counter() - t0
+            elif event["type"] == "done":
+                for key in tokens:
+                    tokens[key] += event["result"]["tokens"].get(key, 0) or 0
+        total.append(time.perf_counter() - t0)
+        if ttft is not None:
+            first_token.append(ttft)
+    n = max(1, len(questions))
+    return {
+        "search_type": SEARCH_TYPE,
+        "total": latency_stats(total),
+        "first_token": latency_stats(first_token),
+        "avg_tokens": {k: round(v / n, 1) for k, v in tokens.items()},
+        "stages": _stage_seconds(("chain.", "embed.")),
+    }
+
+def _flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            out.update(_flatten(v, f"{prefix}{k}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        out[prefix[:-1]] = float(data)
+    return out
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """
+    İki sonuç dosyasının ortak sayısal metriklerindeki yüzde değişimi listeler.
+
+    """
+    keys = ("docs_per_s", "chunks_per_s", "peak_rss_mb", "p50_ms", "p95_ms", "p99_ms", "avg_tokens")
+    cur = _flatten({k: current.get(k) for k in ("ingest", "retrieval", "e2e")})
+    base = _flatten({k: baseline.get(k) for k in ("ingest", "retrieval", "e2e")})
+    lines = []
+    for name in sorted(set(cur) & set(base)):
+        if ".stages." in name or not any(k in name for k in keys) or not base[name]:
+            continue
+        change = (cur[name] - base[name]) / base[name] * 100
+        lines.append(f"{name:<45} {base[name]:>12.3f} -> {cur[name]:>12.3f}  ({change:+.1f}%)")
+    return lines
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="DocuBrain offline benchmark")
+    parser.add_argument("--docs", type=int, default=20, help="Üretilecek doküman sayısı")
+    parser.add_argument("--pages", type=int, default=3, help="Doküman başına sayfa")
+    parser.add_argument("--paragraphs", type=int, default=4, help="Sayfa başına paragraf")
+    parser.add_argument("--pdf-ratio", type=float, default=0.5, help="PDF oranı (geri kalanı DOCX)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval ölçümündeki soru sayısı")
+    parser.add_argument("--e2e-queries", type=int, default=30, help="Uçtan uca ölçümdeki soru sayısı")
+    parser.add_argument("--search-types", default=",".join(SEARCH_TYPES))
+    parser.add_argument("--top-k", type=int, default=None, help="Varsayılan: TOP_K")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--workdir", type=Path, default=None, help="Varsayılan: geçici dizin (sonda silinir)")
+    parser.add_argument("--out", type=Path, default=None, help="Varsayılan: benchmarks/results/bench-<zaman>.json")
+    parser.add_argument("--baseline", type=Path, default=None, help="Karşılaştırılacak önceki sonuç dosyası")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="docubrain-bench-"))
+    prepare_env(workdir)
+
+    import config
+    from corpus import generate_corpus
+
+    top_k = args.top_k or config.TOP_K
+    corpus = generate_corpus(
+        config.UPLOAD_DIRECTORY, docs=args.docs, pages=args.pages, paragraphs=args.paragraphs,
+        pdf_ratio=args.pdf_ratio, seed=args.seed,
+    )
+    probes = corpus["probes"]
+    questions = [probes[i % len(probes)]["question"] for i in range(min(args.queries, len(probes)))]
+    e2e_questions = [probes[-(i + 1)]["question"] for i in range(min(args.e2e_queries, len(probes)))]
+
+    try:
+        results: Dict[str, Any] = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+            },
+            "config": {
+                "EMBEDDING_MODEL_NAME": config.EMBEDDING_MODEL_NAME,
+                "LLM_PROVIDER": config.LLM_PROVIDER,
+                "CHUNK_SIZE": config.CHUNK_SIZE,
+                "CHUNK_OVERLAP": config.CHUNK_OVERLAP,
+                "TOP_K": top_k,
+                "SEARCH_TYPE": config.SEARCH_TYPE,
+                "MMR_LAMBDA": config.MMR_LAMBDA,
+                "CONTEXT_TOKEN_BUDGET": config.CONTEXT_TOKEN_BUDGET,
+                "INGEST_WORKERS": config.INGEST_WORKERS,
+                "EMBED_BATCH_SIZE": config.EMBED_BATCH_SIZE,
+                "QUERY_EMBEDDING_CACHE_SIZE": config.QUERY_EMBEDDING_CACHE_SIZE,
+                "DEDUP_ENABLED": config.DEDUP_ENABLED,
+                "RERANK_ENABLED": config.RERANK_ENABLED,
+            },
+            "corpus": {k: v for k, v in corpus.items() if k not in ("files", "probes")}
+            | {"files": len(corpus["files"]), "probes": len(probes)},
+        }
+        files = [Path(f) for f in corpus["files"]]
+        print(f"[ingest] {len(files)} dosya, {corpus['pages']} sayfa ...", flush=True)
+        results["ingest"] = bench_ingest(files, corpus["pages"])
+        search_types = [s.strip() for s in args.search_types.split(",") if s.strip()]
+        print(f"[retrieval] {len(questions)} soru x {search_types} ...", flush=True)
+        results["retrieval"] = bench_retrieval(questions, search_types, top_k, args.warmup)
+        print(f"[e2e] {len(e2e_questions)} soru ...", flush=True)
+        results["e2e"] = bench_e2e(e2e_questions, top_k)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out or ROOT / "benchmarks" / "results" / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    ing = results["ingest"]
+    print(f"ingest: {ing['seconds']} s, {ing['docs_per_s']} doc/s, {ing['chunks_per_s']} chunk/s, "
+          f"peak RSS {ing['peak_rss_mb']['self']} MB")
+    for search_type, r in results["retrieval"].items():
+        print(f"retrieval[{search_type}]: p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, p99 {r['p99_ms']} ms")
+    e2e = results["e2e"]
+    print(f"e2e: p50 {e2e['total'].get('p50_ms')} ms, ilk token p50 {e2e['first_token'].get('p50_ms')} ms")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        print(f"\n{args.baseline} ile karşılaştırma:")
+        print("\n".join(compare(results, baseline)))
+    print(f"\nSonuç: {out}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,31 @@ Agent modülü - Tool-calling ile gelişmiş RAG
 Bu modül şu görevleri yerine getirir:
 - LangChain Agent oluşturur (tool-calling destekli LLM gerektirir)
 - Retriever'ı bir "tool" olarak sunar (kb_search)
+- kb_search'ün döndürdüğü chunk id/metadata artifact'lerinden kaynak gösterimi üretir
 - Agent otomatik olarak ne zaman retrieval yapacağına karar verir
 - Token kullanımı takibi
 - Dinamik prompt yönetimi (kısa/uzun cevap)
+- Eşzamanlı kullanıcılar için async API (arun_agent)
+- Uzun sohbetlerde geçmişi son turlar + özet olarak gönderir (history.ConversationMemory)
+- Aşama bazlı süre ölçümü (tracing.span: history, run, retrieve, pack_context)
 """
 from __future__ import annotations
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+import asyncio
+import time
 
 from langchain_community.vectorstores import Chroma
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.tools import create_retriever_tool
+from langchain_core.documents import Document
+from langchain_core.tools import StructuredTool
 from langchain_openai import ChatOpenAI
 
 from config import DEFAULT_OPENAI_MODEL
-from rag_chain import format_citations
+from rag_chain import (
+    format_citations, cache_lookup, cache_store, tokens_from_callback, pack_context, retrieval_signature
+)
+from history import ConversationMemory
+from tracing import span, record_stage
 
 AGENT_SYSTEM_SHORT = """
 Sen bir kurumsal bilgi tabanı ajanısın. SORU'ları yanıtlarken **daima** 'kb_search' aracını kullan.
@@ -33,6 +44,8 @@ Yalnızca bu araçtan gelen belgeleri kanıt olarak kabul et ve kanıt yetersizs
 ÖNEMLİ: DETAYLI ve KAPSAMLI cevap ver. Tüm ilgili bilgileri birleştir ve açıkla.
 """.strip()
 
+KB_TOOL_NAME = "kb_search"
+
 def _resolve_agent_executor_class() -> Any:
     """
     LangChain versiyonuna göre AgentExecutor sınıfını bulur.
@@ -73,15 +86,8 @@ def build_agent(llm: ChatOpenAI, retriever, is_short: bool = True) -> Any:
             "create_agent bulunamadı. LangChain sürümü ile uyumsuzluk var. "
             "Lütfen 'pip install \"langchain>=1.0.0\"' komutuyla güncelleyin."
         ) from e
-    # Tool: retriever as a tool, return docs for citations
-    kb_tool = create_retriever_tool(
-        retriever=retriever,
-        name="kb_search",
-        description=(
-            "Kurumsal bilgi tabanında (PDF/DOCX) semantik arama yapar ve ilgili parçaları döndürür. "
-            "Her soru için önce bu aracı kullan ve kanıtlara dayalı cevap ver."
-        ),
-    )
+    # Tool: retriever as a tool, chunk id/metadata artifact'leri kaynak gösterimi için
+    kb_tool = build_kb_tool(retriever)
 
     # Cevap stiline göre system prompt seç
     system_prompt = AGENT_SYSTEM_SHORT if is_short else AGENT_SYSTEM_DETAILED
@@ -93,48 +99,306 @@ def build_agent(llm: ChatOpenAI, retriever, is_short: bool = True) -> Any:
         system_prompt=system_prompt
     )
     
+    # Cevap önbelleği anahtarı için: farklı retrieval ayarlarıyla üretilmiş cevaplar karışmasın
+    agent.retrieval_config = retrieval_signature(retriever)
+
     # Agent artık CompiledStateGraph döndürüyor, doğrudan kullanılabilir
     return agent
 
-def run_agent(executor: Any, question: str, chat_history: List) -> Dict:
+def _cache_mode(executor: Any) -> str:
+    """
+    Agent cevaplarının önbellek modu; kb_search retriever'ının ayar özetini içerir.
+
+    """
+    signature = getattr(executor, "retrieval_config", None)
+    return f"agent:{signature}" if signature else "agent"
+
+def build_kb_tool(retriever) -> StructuredTool:
+    """
+    Retriever'ı agent aracı olarak sarar. Model paketlenmiş bağlam metnini görür;
+    kullanılan chunk'ların id ve metadata'sı ToolMessage.artifact olarak taşınır.
+    
+    """
+    def _result(docs: List[Document]) -> Tuple[str, List[Dict[str, Any]]]:
+        with span("agent.pack_context") as sp:
+            context, used, info = pack_context(docs)
+            sp.set(chunks=len(used), **info)
+        return context, [{"id": d.id, "metadata": d.metadata or {}} for d in used]
+
+    def kb_search(query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        with span("agent.retrieve") as sp:
+            docs = retriever.invoke(query)
+            sp.set(chunks=len(docs))
+        return _result(docs)
+
+    async def akb_search(query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        with span("agent.retrieve") as sp:
+            docs = await retriever.ainvoke(query)
+            sp.set(chunks=len(docs))
+        return _result(docs)
+
+    return StructuredTool.from_function(
+        func=kb_search,
+        coroutine=akb_search,
+        name=KB_TOOL_NAME,
+        description=(
+            "Kurumsal bilgi tabanında (PDF/DOCX) semantik arama yapar ve ilgili parçaları döndürür. "
+            "Her soru için önce bu aracı kullan ve kanıtlara dayalı cevap ver."
+        ),
+        response_format="content_and_artifact",
+    )
+
+def collect_tool_docs(messages: List[Any]) -> List[Document]:
+    """
+    Mesajlardaki kb_search artifact'lerinden (ek arama yapmadan) kaynak dokümanları
+    toplar; birden fazla araç çağrısında aynı chunk bir kez alınır.
+    
+    """
+    from langchain_core.messages import ToolMessage
+
+    docs: List[Document] = []
+    seen = set()
+    for msg in messages:
+        if not isinstance(msg, ToolMessage) or msg.name != KB_TOOL_NAME or not msg.artifact:
+            continue
+        for item in msg.artifact:
+            meta = item.get("metadata") or {}
+            key = item.get("id") or (meta.get("source"), meta.get("page"), meta.get("start_index"))
+            if key in seen:
+                continue
+            seen.add(key)
+            docs.append(Document(id=item.get("id"), page_content="", metadata=meta))
+    return docs
+
+def run_agent(
+    executor: Any,
+    question: str,
+    chat_history: List,
+    is_short: bool = True,
+    model_name: str = DEFAULT_OPENAI_MODEL,
+    memory: Optional[ConversationMemory] = None,
+) -> Dict:
     """
     Agent'i çalıştırır ve soru cevaplar.
+    Aynı/benzer soru önbellekte varsa agent çalıştırılmaz (sadece geçmişsiz sorular önbelleklenir).
+    chat_history mevcut soruyu içermemelidir; memory verilirse eski turlar
+    özetlenir, verilmezse sadece son turlar gönderilir.
     
     """
     # LangChain 1.0+ create_agent: invoke ile {"messages": []} formatı kullanır
     from langchain_core.messages import HumanMessage, AIMessage
     from langchain_community.callbacks import get_openai_callback
     
-    messages = []
-    for msg in chat_history:
-        messages.append(msg)
-    
-    # Son soruyu ekle
-    messages.append(HumanMessage(content=question))
-    
-    # Agent'i çalıştır - token tracking ile
-    with get_openai_callback() as cb:
-        result = executor.invoke({"messages": messages})
-        tokens_used = {
-            "prompt_tokens": cb.prompt_tokens,
-            "completion_tokens": cb.completion_tokens,
-            "total_tokens": cb.total_tokens,
-            "total_cost": cb.total_cost
+    # Takip soruları ("peki ya ikincisi?") konuşmaya bağlıdır: geçmiş varken önbellek kullanılmaz
+    use_cache = not chat_history
+    cache_mode = _cache_mode(executor)
+    with span("agent", mode="sync") as root:
+        with span("agent.cache_lookup"):
+            cached, query_vec = (
+                cache_lookup(question, mode=cache_mode, is_short=is_short, model=model_name) if use_cache else (None, None)
+            )
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            cached["raw"] = None
+            return cached
+
+        memory = memory or ConversationMemory(model_name=model_name)
+        
+        # Agent'i çalıştır - token tracking ile (özetleme çağrısı da sayılır)
+        with get_openai_callback() as cb:
+            with span("agent.history") as sp:
+                messages, history_info = memory.prepare(chat_history)
+                sp.set(**history_info)
+            # Son soruyu ekle
+            messages.append(HumanMessage(content=question))
+            turn_start = len(messages)
+            with span("agent.run") as sp:
+                result = executor.invoke({"messages": messages})
+                sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+            tokens_used = {
+                "prompt_tokens": cb.prompt_tokens,
+                "completion_tokens": cb.completion_tokens,
+                "total_tokens": cb.total_tokens,
+                "total_cost": cb.total_cost
+            }
+        tokens_used.update(history_info)
+        
+        # Cevabı al - LangChain 1.0+ 'messages' listesinin son elemanı cevaptır
+        answer = ""
+        if "messages" in result and result["messages"]:
+            last_message = result["messages"][-1]
+            answer = last_message.content if hasattr(last_message, 'content') else str(last_message)
+        
+        # Sadece bu turdaki araç çağrılarının artifact'leri
+        docs = collect_tool_docs(result.get("messages", [])[turn_start:])
+        cites = format_citations(docs)
+        out = {
+            "answer": answer, 
+            "docs": docs, 
+            "citations": cites, 
+            "raw": result,
+            "tokens": tokens_used
         }
+        if use_cache:
+            with span("agent.cache_store"):
+                cache_store(question, out, mode=cache_mode, is_short=is_short, model=model_name, embedding=query_vec)
+        else:
+            out["cache"] = None
+        return out
+
+def stream_agent(
+    executor: Any,
+    question: str,
+    chat_history: List,
+    is_short: bool = True,
+    model_name: str = DEFAULT_OPENAI_MODEL,
+    memory: Optional[ConversationMemory] = None,
+) -> Iterator[Dict]:
+    """
+    run_agent'in streaming versiyonu. Final cevabın token'larını geldikçe üretir:
+    {"type": "token", "content"}, her kb_search sonucundan sonra o ana kadar
+    toplanan {"type": "sources", "docs", "citations"} ve en sonda {"type": "done", "result"}.
     
-    # Cevabı al - LangChain 1.0+ 'messages' listesinin son elemanı cevaptır
-    answer = ""
-    if "messages" in result and result["messages"]:
-        last_message = result["messages"][-1]
-        answer = last_message.content if hasattr(last_message, 'content') else str(last_message)
+    """
+    from langchain_core.messages import AIMessageChunk, HumanMessage, ToolMessage
+    from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+
+    use_cache = not chat_history  # Bkz. run_agent
+    cache_mode = _cache_mode(executor)
+    with span("agent", mode="stream") as root:
+        with span("agent.cache_lookup"):
+            cached, query_vec = (
+                cache_lookup(question, mode=cache_mode, is_short=is_short, model=model_name) if use_cache else (None, None)
+            )
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            cached["raw"] = None
+            yield {"type": "sources", "docs": cached["docs"], "citations": cached["citations"]}
+            yield {"type": "token", "content": cached["answer"]}
+            yield {"type": "done", "result": cached}
+            return
+
+        cb = OpenAICallbackHandler()
+        memory = memory or ConversationMemory(model_name=model_name)
+        with span("agent.history") as sp:
+            messages, history_info = memory.prepare(chat_history, callbacks=[cb])
+            sp.set(**history_info)
+        messages.append(HumanMessage(content=question))
+        turn_start = len(messages)
+
+        final_state: Dict = {}
+        tool_messages: List[ToolMessage] = []
+        parts: List[str] = []
+        first_token = True
+        with span("agent.run") as sp:
+            # "messages": LLM token'ları, "values": her adımdan sonraki tam state
+            for mode, payload in executor.stream(
+                {"messages": messages}, config={"callbacks": [cb]}, stream_mode=["messages", "values"]
+            ):
+                if mode == "values":
+                    final_state = payload
+                    continue
+                chunk, _meta = payload
+                if isinstance(chunk, ToolMessage):
+                    parts = []  # Araç çağrısından önceki ara metinler final cevaba dahil değil
+                    if chunk.name == KB_TOOL_NAME:
+                        tool_messages.append(chunk)
+                        docs = collect_tool_docs(tool_messages)
+                        yield {"type": "sources", "docs": docs, "citations": format_citations(docs)}
+                elif isinstance(chunk, AIMessageChunk) and isinstance(chunk.content, str) and chunk.content:
+                    if first_token:
+                        record_stage("agent.first_token", root.elapsed())
+                        first_token = False
+                    parts.append(chunk.content)
+                    yield {"type": "token", "content": chunk.content}
+            sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+
+        answer = "".join(parts)
+        if final_state.get("messages"):
+            last_message = final_state["messages"][-1]
+            answer = last_message.content if hasattr(last_message, 'content') else answer
+            docs = collect_tool_docs(final_state["messages"][turn_start:])
+        else:
+            docs = collect_tool_docs(tool_messages)
+
+        out = {
+            "answer": answer,
+            "docs": docs,
+            "citations": format_citations(docs),
+            "raw": final_state,
+            "tokens": {**tokens_from_callback(cb), **history_info},
+        }
+        if use_cache:
+            with span("agent.cache_store"):
+                cache_store(question, out, mode=cache_mode, is_short=is_short, model=model_name, embedding=query_vec)
+        else:
+            out["cache"] = None
+        yield {"type": "done", "result": out}
+
+async def arun_agent(
+    executor: Any,
+    question: str,
+    chat_history: List,
+    is_short: bool = True,
+    model_name: str = DEFAULT_OPENAI_MODEL,
+    memory: Optional[ConversationMemory] = None,
+) -> Dict:
+    """
+    run_agent'in async versiyonu. Agent çalışması süreç başına
+    LLM_MAX_CONCURRENCY ile sınırlanır.
     
-    # TODO: Citations için tool çağrılarını topla (şu an basit versiyon)
-    docs = []
-    cites = ""
-    return {
-        "answer": answer, 
-        "docs": docs, 
-        "citations": cites, 
-        "raw": result,
-        "tokens": tokens_used
-    }
+    """
+    from langchain_core.messages import HumanMessage
+    from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+    from llm_clients import llm_slot
+
+    use_cache = not chat_history  # Bkz. run_agent
+    cache_mode = _cache_mode(executor)
+    with span("agent", mode="async") as root:
+        cached, query_vec = None, None
+        if use_cache:
+            with span("agent.cache_lookup"):
+                cached, query_vec = await asyncio.to_thread(
+                    cache_lookup, question, mode=cache_mode, is_short=is_short, model=model_name
+                )
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            cached["raw"] = None
+            return cached
+
+        cb = OpenAICallbackHandler()
+        memory = memory or ConversationMemory(model_name=model_name)
+        with span("agent.history") as sp:
+            messages, history_info = await asyncio.to_thread(memory.prepare, chat_history, [cb])
+            sp.set(**history_info)
+        messages.append(HumanMessage(content=question))
+        turn_start = len(messages)
+
+        t_wait = time.perf_counter()
+        async with llm_slot():
+            record_stage("agent.llm_wait", time.perf_counter() - t_wait)  # LLM_MAX_CONCURRENCY kuyruğu
+            with span("agent.run") as sp:
+                result = await executor.ainvoke({"messages": messages}, config={"callbacks": [cb]})
+                sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+
+        answer = ""
+        if "messages" in result and result["messages"]:
+            last_message = result["messages"][-1]
+            answer = last_message.content if hasattr(last_message, 'content') else str(last_message)
+        docs = collect_tool_docs(result.get("messages", [])[turn_start:])
+
+        out = {
+            "answer": answer,
+            "docs": docs,
+            "citations": format_citations(docs),
+            "raw": result,
+            "tokens": {**tokens_from_callback(cb), **history_info},
+        }
+        if use_cache:
+            with span("agent.cache_store"):
+                await asyncio.to_thread(
+                    cache_store, question, out, mode=cache_mode, is_short=is_short, model=model_name, embedding=query_vec
+                )
+        else:
+            out["cache"] = None
+        return out
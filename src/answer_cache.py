@@ -0,0 +1,237 @@
+"""
+Cevap önbelleği modülü - Semantik answer cache
+
+Bu modül şu görevleri yerine getirir:
+- Cevapları SQLite'ta kalıcı olarak saklar (WAL modu)
+- Normalize edilmiş soru ile birebir eşleşme veya soru embedding'i ile
+  benzerlik eşiği üzerinden eşleşme arar
+- Eşleşme için cevap stili (is_short), model, mod ve indeks sürümü aynı olmalıdır
+- LRU + TTL ile eski kayıtları atar; indeks sürümü değişince kayıtlar geçersizleşir
+- Hit / miss / kazanılan token sayaçlarını tutar
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_FILE, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_HOURS, ANSWER_CACHE_SIMILARITY,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question_norm TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    is_short INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    index_version TEXT NOT NULL,
+    embedding BLOB,
+    answer TEXT NOT NULL,
+    citations TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answers_key ON answers (index_version, mode, is_short, model, question_norm);
+CREATE INDEX IF NOT EXISTS idx_answers_lru ON answers (last_access);
+"""
+
+def normalize_question(question: str) -> str:
+    """
+    Soruyu birebir eşleşme için normalize eder (küçük harf, noktalama ve boşluk).
+
+    """
+    from sparse_index import tokenize
+
+    return " ".join(tokenize(question))
+
+class AnswerCache:
+    """
+    Soru → cevap önbelleği (birebir + semantik eşleşme, LRU + TTL).
+
+    """
+
+    def __init__(
+        self,
+        path: Path = ANSWER_CACHE_FILE,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_HOURS * 3600,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.stats = {"hits": 0, "misses": 0, "saved_tokens": 0}
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # Semantik arama için (index_version, mode, is_short, model) -> (id'ler, matris)
+        self._vectors: Dict[Tuple, Tuple[np.ndarray, np.ndarray]] = {}
+        self._data_version: Optional[int] = None
+
+    def _purge(self, index_version: str) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        cur = self._conn.execute(
+            "DELETE FROM answers WHERE index_version != ? OR created < ?", (index_version, cutoff)
+        )
+        if cur.rowcount:
+            self._conn.commit()
+            self._vectors.clear()
+
+    def _matrix(self, key: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+        # Başka bir süreç/bağlantı yazdıysa bellekteki matrisleri tazele
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._vectors.clear()
+            self._data_version = data_version
+        if key not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM answers WHERE index_version=? AND mode=? AND is_short=? "
+                "AND model=? AND embedding IS NOT NULL",
+                key,
+            ).fetchall()
+            ids = np.array([r[0] for r in rows], dtype=np.int64)
+            mat = (
+                np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                if rows else np.zeros((0, 0), dtype=np.float32)
+            )
+            self._vectors[key] = (ids, mat)
+        return self._vectors[key]
+
+    def lookup(
+        self,
+        question: str,
+        *,
+        mode: str,
+        is_short: bool,
+        model: str,
+        index_version: str,
+        embed_fn=None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Önbellekte cevap arar; önce birebir, sonra embedding benzerliği ile.
+        embed_fn verilmezse sadece birebir eşleşme yapılır.
+
+        """
+        key = (index_version, mode, int(is_short), model)
+        norm = normalize_question(question)
+        with self._lock:
+            self._purge(index_version)
+            row = self._conn.execute(
+                "SELECT id FROM answers WHERE index_version=? AND mode=? AND is_short=? AND model=? "
+                "AND question_norm=? ORDER BY last_access DESC LIMIT 1",
+                (*key, norm),
+            ).fetchone()
+            entry_id = row[0] if row else None
+
+        if entry_id is None and embed_fn is not None:
+            query_vec = self._normalize(embed_fn(question))
+            with self._lock:
+                ids, mat = self._matrix(key)
+                if len(ids) and mat.shape[1] == len(query_vec):
+                    sims = mat @ query_vec
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.similarity:
+                        entry_id = int(ids[best])
+
+        with self._lock:
+            if entry_id is None:
+                self.stats["misses"] += 1
+                return None
+            row = self._conn.execute(
+                "SELECT answer, citations, sources, total_tokens FROM answers WHERE id=?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_access=? WHERE id=?", (time.time(), entry_id))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            self.stats["saved_tokens"] += row[3]
+            return {"answer": row[0], "citations": row[1], "sources": json.loads(row[2]), "total_tokens": row[3]}
+
+    def store(
+        self,
+        question: str,
+        *,
+        mode: str,
+        is_short: bool,
+        model: str,
+        index_version: str,
+        answer: str,
+        citations: str,
+        sources: List[Dict[str, Any]],
+        total_tokens: int,
+        embedding: Optional[List[float]] = None,
+    ) -> None:
+        """
+        Cevabı önbelleğe yazar ve LRU sınırını aşan en eski kayıtları siler.
+
+        """
+        blob = self._normalize(embedding).tobytes() if embedding is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (question_norm, mode, is_short, model, index_version, embedding, "
+                "answer, citations, sources, total_tokens, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_question(question), mode, int(is_short), model, index_version, blob,
+                    answer, citations, json.dumps(sources, ensure_ascii=False), int(total_tokens), now, now,
+                ),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+            self._vectors.clear()
+
+    def clear(self) -> None:
+        """
+        Tüm önbelleği siler.
+
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._vectors.clear()
+
+    def report(self, hit: bool) -> Dict[str, Any]:
+        """
+        Sonuç sözlüğüne eklenecek önbellek bilgisini döndürür.
+
+        """
+        return {"hit": hit, **self.stats}
+
+    @staticmethod
+    def _normalize(vec: List[float]) -> np.ndarray:
+        arr = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        return arr / norm if norm > 0 else arr
+
+_CACHE_LOCK = threading.Lock()
+_CACHE: Optional[AnswerCache] = None
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Süreç genelinde paylaşılan cevap önbelleğini döndürür.
+
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AnswerCache()
+        return _CACHE
@@ -17,7 +17,7 @@ def get_imports():
 def get_rag_imports():
     """Lazy imports for RAG functionality"""
     try:
-        from ingest import index_files, get_vectorstore, reset_vectorstore
+        from ingest import index_files, get_vectorstore, reset_vectorstore, delete_source
         from rag_chain import build_retriever, answer_with_chain
         from agent import build_agent, run_agent
         return True, None
@@ -58,12 +58,11 @@ if not config_success:
     st.stop()
 
 # Import everything now that we know it works
-from langchain_openai import ChatOpenAI
 from langchain_community.chat_models import ChatOllama
 from langchain_core.messages import AIMessage, HumanMessage
-from ingest import index_files, get_vectorstore, reset_vectorstore
-from rag_chain import build_retriever, answer_with_chain
-from agent import build_agent, run_agent
+from ingest import index_files, get_vectorstore, reset_vectorstore, delete_source
+from rag_chain import build_retriever, stream_answer_with_chain
+from agent import build_agent, stream_agent
 # Logger removed for simplicity
 from config import (
     UPLOAD_DIRECTORY, PERSIST_DIRECTORY,
@@ -71,20 +70,57 @@ from config import (
     SEARCH_TYPE, TOP_K, MMR_LAMBDA
 )
 from rag_chain import ensure_dirs
-from chat_storage import save_chat_history, load_chat_history, clear_chat_history
+from chat_storage import append_chat_message, load_chat_history, clear_chat_history
+from embeddings import get_embedding_stats
+from llm_clients import create_llm
+from history import ConversationMemory
+
+def render_answer_stream(events):
+    """
+    Streaming cevabı token token yazdırır, kaynakları geldiği anda gösterir
+    ve final sonuç sözlüğünü döndürür.
+    
+    """
+    answer_area = st.container()
+    sources_slot = st.empty()
+    state = {"result": None}
+
+    def _tokens():
+        for event in events:
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "sources" and event["citations"]:
+                sources_slot.caption(event["citations"])
+            elif event["type"] == "done":
+                state["result"] = event["result"]
+
+    with answer_area:
+        st.write_stream(_tokens())
+    result = state["result"]
+    if result and result["citations"]:
+        sources_slot.caption(result["citations"])
+    if result and result.get("cache") and result["cache"]["hit"]:
+        st.caption(f"⚡ Önbellekten yanıtlandı (kazanılan token: {result['cache']['saved_tokens']})")
+    return result
 
 # State
 if "vectorstore" not in st.session_state:
     st.session_state.vectorstore = None
 if "retriever" not in st.session_state:
     st.session_state.retriever = None
-# Chat history will be loaded from file storage
+# Chat history will be loaded from file storage (?user=...&session=... ile ayrı geçmişler)
+if "chat_user" not in st.session_state:
+    st.session_state.chat_user = st.query_params.get("user", "default")
+    st.session_state.chat_session = st.query_params.get("session", "default")
+chat_ids = {"user_id": st.session_state.chat_user, "session_id": st.session_state.chat_session}
 if "chat_history_chain" not in st.session_state:
-    st.session_state.chat_history_chain = load_chat_history("rag_chain")
+    st.session_state.chat_history_chain = load_chat_history("rag_chain", **chat_ids)
 if "chat_history_agent" not in st.session_state:
-    st.session_state.chat_history_agent = load_chat_history("agent")
+    st.session_state.chat_history_agent = load_chat_history("agent", **chat_ids)
 if "agent_exec" not in st.session_state:
     st.session_state.agent_exec = None
+if "agent_memory" not in st.session_state:
+    st.session_state.agent_memory = ConversationMemory()  # Eski turların artımlı özeti
 if "uploaded_files" not in st.session_state:
     st.session_state.uploaded_files = []
 if "indexed_files" not in st.session_state:
@@ -132,6 +168,13 @@ with st.sidebar:
     st.info("🚀 **GPT-4o-mini** seçildi (hızlı + ekonomik)")
     st.caption("OpenAI GPT-4o-mini modeli kullanılıyor.")
 
+    emb_stats = get_embedding_stats()
+    if emb_stats["load_seconds"] is not None:
+        st.caption(
+            f"🧩 Embedding: {emb_stats['model_name']} "
+            f"(yükleme {emb_stats['load_seconds']:.1f}s, warm-up {emb_stats['warmup_seconds']:.2f}s)"
+        )
+
     if st.button("🗑️ Veri Tabanını Sıfırla"):
         reset_vectorstore()
         st.session_state.vectorstore = None
@@ -186,9 +229,25 @@ with tab_kb:
                 import time
                 start_t = time.time()
                 with st.spinner("Belgeler indeksleniyor, lütfen bekleyin…"):
-                    raw_n, chunk_n = index_files(path_list)
+                    progress_bar = st.progress(0.0, text="Dosyalar kontrol ediliyor…")
+
+                    def _on_progress(p):
+                        total = max(p["files_total"], 1)
+                        progress_bar.progress(
+                            min(p["files_done"] / total, 1.0),
+                            text=f"{p['files_done']}/{p['files_total']} dosya, {p['chunks_done']} parça yazıldı",
+                        )
+
+                    report = index_files(path_list, progress_callback=_on_progress)
+                    progress_bar.empty()
                 elapsed = time.time() - start_t
-                st.success(f"Yüklendi: {raw_n} belge, {chunk_n} parça eklendi. ({elapsed:.1f}s)")
+                st.success(
+                    f"Yüklendi: {report['documents']} belge, {report['chunks']} parça eklendi. "
+                    f"(yeni: {report['added']}, güncellenen: {report['updated']}, "
+                    f"silinen: {report['deleted']}, değişmeyen: {report['skipped']}) ({elapsed:.1f}s)"
+                )
+                for failed_path, err in report["errors"].items():
+                    st.warning(f"⚠️ {Path(failed_path).name} indekslenemedi: {err}")
                 st.session_state.vectorstore = get_vectorstore()
                 st.session_state.retriever = build_retriever(
                     st.session_state.vectorstore,
@@ -251,9 +310,10 @@ with tab_kb:
                         for file_path in st.session_state.indexed_files:
                             if file_path.name == file_name:
                                 try:
-                                    # Dosyayı fiziksel olarak sil
+                                    # Önce chunk'larını indeksten kaldır, sonra dosyayı sil
+                                    result = delete_source(file_path)
                                     file_path.unlink()
-                                    st.success(f"✅ {file_name} silindi")
+                                    st.success(f"✅ {file_name} silindi ({result['deleted']} parça kaldırıldı)")
                                 except Exception as e:
                                     st.error(f"❌ {file_name} silinemedi: {e}")
                     
@@ -262,17 +322,8 @@ with tab_kb:
                         f for f in st.session_state.indexed_files 
                         if f.name not in selected_files
                     ]
-                    
-                    # Eğer tüm dosyalar silindiyse vectorstore'u temizle
-                    if not st.session_state.indexed_files:
-                        reset_vectorstore()
-                        st.session_state.vectorstore = None
-                        st.session_state.retriever = None
-                        st.session_state.agent_exec = None
-                        st.info("Tüm dosyalar silindi. Veri tabanı sıfırlandı.")
-                    else:
-                        # Kalan dosyalar varsa yeniden indeksle
-                        st.warning("⚠️ Dosyalar silindi. Değişikliklerin etkili olması için 'İndeksle' butonuna tıklayın.")
+                    # Retriever aynı koleksiyonu kullanmaya devam eder; agent yeniden kurulsun
+                    st.session_state.agent_exec = None
                     
                     st.rerun()
     else:
@@ -289,9 +340,10 @@ with tab_chat:
         st.subheader("Sohbet")
     with col2:
         if st.button("🗑️ Sohbeti Temizle", help="Tüm sohbet geçmişini sil"):
-            clear_chat_history()  # Tüm sohbet geçmişini temizle
+            clear_chat_history(**chat_ids)  # Bu oturumun tüm sohbet geçmişini temizle
             st.session_state.chat_history_chain = []
             st.session_state.chat_history_agent = []
+            st.session_state.agent_memory.reset()
             st.success("✅ Sohbet geçmişi temizlendi!")
             st.rerun()
     
@@ -311,10 +363,11 @@ with tab_chat:
     # LLM init - Sadece OpenAI
     llm = None
     if OPENAI_API_KEY:
-        llm = ChatOpenAI(
-            model=openai_model, 
+        # Tüm oturumlar aynı HTTP bağlantı havuzunu paylaşır
+        llm = create_llm(
+            openai_model,
             temperature=0.1,
-            max_tokens=1000
+            max_tokens=1000,
         )  # tool-calling destekli + maliyet optimizasyonu
     else:
         # Fallback (chain modunda çalışır). Ollama kurulu değilse hata verir.
@@ -353,42 +406,49 @@ with tab_chat:
         if mode == "RAG Chain":
             # RAG Chain modu
             st.session_state.chat_history_chain.append(HumanMessage(content=question))
+            append_chat_message(st.session_state.chat_history_chain[-1], "rag_chain", **chat_ids)
             
             # Cevap stiline göre is_short parametresini belirle
             is_short = (answer_style == "Kısa ve Öz")
-            result = answer_with_chain(llm, st.session_state.retriever, question, is_short)
+            with chat_container:
+                with st.chat_message("user"):
+                    st.markdown(question)
+                with st.chat_message("assistant"):
+                    result = render_answer_stream(
+                        stream_answer_with_chain(llm, st.session_state.retriever, question, is_short)
+                    )
             
             answer = result["answer"]
             cites = result["citations"]
             st.session_state.chat_history_chain.append(AIMessage(content=answer + ("\n\n" + cites if cites else "")))
             
-            # Sohbet geçmişini dosyaya kaydet
-            save_chat_history(st.session_state.chat_history_chain, "rag_chain")
-            
-            with chat_container:
-                with st.chat_message("assistant"):
-                    st.markdown(answer)
-                    if cites:
-                        st.caption(cites)
+            # Sadece yeni mesajı dosyaya ekle
+            append_chat_message(st.session_state.chat_history_chain[-1], "rag_chain", **chat_ids)
             
             # Logging removed for simplicity
         else:
             # Agent modu
             if st.session_state.agent_exec:
                 st.session_state.chat_history_agent.append(HumanMessage(content=question))
-                result = run_agent(st.session_state.agent_exec, question, st.session_state.chat_history_agent)
+                append_chat_message(st.session_state.chat_history_agent[-1], "agent", **chat_ids)
+                is_short = (answer_style == "Kısa ve Öz")
+                with chat_container:
+                    with st.chat_message("user"):
+                        st.markdown(question)
+                    with st.chat_message("assistant"):
+                        memory = st.session_state.agent_memory
+                        memory.llm, memory.model_name = llm, openai_model
+                        # Soru listeye zaten eklendi; geçmiş olarak sadece önceki mesajlar gider
+                        result = render_answer_stream(stream_agent(
+                            st.session_state.agent_exec, question, st.session_state.chat_history_agent[:-1],
+                            is_short=is_short, model_name=openai_model, memory=memory,
+                        ))
                 answer = result["answer"]
                 cites = result["citations"]
                 st.session_state.chat_history_agent.append(AIMessage(content=answer + ("\n\n" + cites if cites else "")))
                 
-                # Sohbet geçmişini dosyaya kaydet
-                save_chat_history(st.session_state.chat_history_agent, "agent")
-                
-                with chat_container:
-                    with st.chat_message("assistant"):
-                        st.markdown(answer)
-                        if cites:
-                            st.caption(cites)
+                # Sadece yeni mesajı dosyaya ekle
+                append_chat_message(st.session_state.chat_history_agent[-1], "agent", **chat_ids)
                 
                 # Logging removed for simplicity
             else:
@@ -2,111 +2,171 @@
 Sohbet geçmişi depolama modülü - Kalıcı sohbet geçmişi
 
 Bu modül şu görevleri yerine getirir:
-- Sohbet geçmişini JSON dosyasında saklama
-- Sohbet geçmişini yükleme
+- Sohbet geçmişini kullanıcı / oturum / mod başına ayrı JSONL dosyalarında saklama
+- Her mesajı gerçek zaman damgasıyla tek bir satır olarak ekleme (append-only)
+- Sohbet geçmişinin sadece son N mesajını dosyanın sonundan okuyarak yükleme
 - Sohbet geçmişini temizleme
-- Sohbet geçmişini yedekleme
+- Eski tek dosyalık chat_history.json'u yeni düzene taşıma
 """
 import json
 import os
+import re
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
-# Sohbet geçmişi dosya yolu
-CHAT_HISTORY_FILE = Path("storage/chat_history.json")
+from config import CHAT_HISTORY_DIR, CHAT_HISTORY_LOAD_LIMIT
 
-def ensure_chat_storage():
-    """Sohbet depolama dizinini oluşturur."""
-    CHAT_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+# Eski (tek dosya, her kayıtta tamamen yeniden yazılan) sohbet geçmişi
+LEGACY_CHAT_HISTORY_FILE = Path("storage/chat_history.json")
+DEFAULT_USER = "default"
+DEFAULT_SESSION = "default"
+_READ_BLOCK = 64 * 1024
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", value).strip("._") or "default"
+
+def _shard_path(mode: str, user_id: str, session_id: str) -> Path:
+    """
+    Kullanıcı / oturum / mod için JSONL dosya yolunu döndürür.
+
+    """
+    return CHAT_HISTORY_DIR / _safe_name(user_id) / _safe_name(session_id) / f"{_safe_name(mode)}.jsonl"
+
+def _to_record(msg: BaseMessage, timestamp: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    if isinstance(msg, HumanMessage):
+        msg_type = "human"
+    elif isinstance(msg, AIMessage):
+        msg_type = "ai"
+    else:
+        return None
+    return {"type": msg_type, "content": msg.content, "timestamp": timestamp or datetime.now().isoformat()}
+
+def _from_record(record: Dict[str, Any]) -> Optional[BaseMessage]:
+    if record.get("type") == "human":
+        return HumanMessage(content=record["content"])
+    if record.get("type") == "ai":
+        return AIMessage(content=record["content"])
+    return None
+
+def _append_records(path: Path, records: List[Dict[str, Any]]) -> None:
+    if not records:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    # O_APPEND: eşzamanlı oturumlar birbirinin satırlarını ezmez
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0))
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+def _tail_lines(path: Path, limit: int) -> List[bytes]:
+    """
+    Dosyanın sonundan geriye doğru blok blok okuyarak son `limit` satırı döndürür.
+
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        while pos > 0 and buf.count(b"\n") <= limit:
+            step = min(_READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    lines = [line for line in buf.split(b"\n") if line.strip()]
+    return lines[-limit:]
+
+def _migrate_legacy(user_id: str, session_id: str) -> None:
+    """
+    Eski chat_history.json içeriğini varsayılan oturuma (orijinal zaman damgalarıyla) taşır.
 
-def save_chat_history(chat_history: List[BaseMessage], mode: str = "rag_chain"):
     """
-    Sohbet geçmişini dosyaya kaydeder.
-    
+    if not LEGACY_CHAT_HISTORY_FILE.exists() or (user_id, session_id) != (DEFAULT_USER, DEFAULT_SESSION):
+        return
+    try:
+        with open(LEGACY_CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return
+    for mode, messages in data.items():
+        path = _shard_path(mode, user_id, session_id)
+        if not path.exists():
+            _append_records(path, [m for m in messages if m.get("type") in ("human", "ai")])
+    LEGACY_CHAT_HISTORY_FILE.replace(LEGACY_CHAT_HISTORY_FILE.with_suffix(".json.migrated"))
+
+def append_chat_message(
+    message: BaseMessage,
+    mode: str = "rag_chain",
+    user_id: str = DEFAULT_USER,
+    session_id: str = DEFAULT_SESSION,
+) -> None:
+    """
+    Tek bir mesajı oluşturulduğu andaki zaman damgasıyla geçmişe ekler.
+
     Args:
-        chat_history: Sohbet geçmişi mesajları
+        message: Eklenecek mesaj (HumanMessage / AIMessage)
         mode: Sohbet modu ("rag_chain" veya "agent")
+        user_id: Kullanıcı kimliği
+        session_id: Oturum kimliği
     """
-    ensure_chat_storage()
-    
-    # Mesajları serialize et
-    messages = []
-    for msg in chat_history:
-        if isinstance(msg, HumanMessage):
-            messages.append({"type": "human", "content": msg.content, "timestamp": datetime.now().isoformat()})
-        elif isinstance(msg, AIMessage):
-            messages.append({"type": "ai", "content": msg.content, "timestamp": datetime.now().isoformat()})
-    
-    # Mevcut geçmişi yükle
-    existing_data = load_all_chat_history()
-    
-    # Yeni geçmişi ekle
-    existing_data[mode] = messages
-    
-    # Dosyaya kaydet
-    with open(CHAT_HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, ensure_ascii=False, indent=2)
-
-def load_chat_history(mode: str = "rag_chain") -> List[BaseMessage]:
+    record = _to_record(message)
+    if record is not None:
+        _append_records(_shard_path(mode, user_id, session_id), [record])
+
+def load_chat_history(
+    mode: str = "rag_chain",
+    limit: int = CHAT_HISTORY_LOAD_LIMIT,
+    user_id: str = DEFAULT_USER,
+    session_id: str = DEFAULT_SESSION,
+) -> List[BaseMessage]:
     """
-    Sohbet geçmişini dosyadan yükler.
-    
+    Sohbet geçmişinin son `limit` mesajını yükler (tüm dosyayı okumadan).
+
     Args:
         mode: Sohbet modu ("rag_chain" veya "agent")
-    
+        limit: Yüklenecek en fazla mesaj sayısı
+        user_id: Kullanıcı kimliği
+        session_id: Oturum kimliği
+
     Returns:
         Sohbet geçmişi mesajları
     """
-    if not CHAT_HISTORY_FILE.exists():
-        return []
-    
-    try:
-        with open(CHAT_HISTORY_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        messages = data.get(mode, [])
-        chat_history = []
-        
-        for msg_data in messages:
-            if msg_data["type"] == "human":
-                chat_history.append(HumanMessage(content=msg_data["content"]))
-            elif msg_data["type"] == "ai":
-                chat_history.append(AIMessage(content=msg_data["content"]))
-        
-        return chat_history
-    except Exception:
+    _migrate_legacy(user_id, session_id)
+    path = _shard_path(mode, user_id, session_id)
+    if not path.exists() or limit <= 0:
         return []
 
-def load_all_chat_history() -> Dict[str, List[Dict]]:
-    """Tüm sohbet geçmişini yükler."""
-    if not CHAT_HISTORY_FILE.exists():
-        return {"rag_chain": [], "agent": []}
-    
-    try:
-        with open(CHAT_HISTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
-        return {"rag_chain": [], "agent": []}
+    chat_history = []
+    for line in _tail_lines(path, limit):
+        try:
+            msg = _from_record(json.loads(line))
+        except Exception:
+            continue  # Yarım yazılmış / bozuk satırı atla
+        if msg is not None:
+            chat_history.append(msg)
+    return chat_history
 
-def clear_chat_history(mode: str = None):
+def clear_chat_history(
+    mode: Optional[str] = None,
+    user_id: str = DEFAULT_USER,
+    session_id: str = DEFAULT_SESSION,
+):
     """
     Sohbet geçmişini temizler.
-    
+
     Args:
         mode: Temizlenecek mod (None = hepsi)
+        user_id: Kullanıcı kimliği
+        session_id: Oturum kimliği
     """
+    _migrate_legacy(user_id, session_id)
     if mode is None:
-        # Tüm geçmişi temizle
-        if CHAT_HISTORY_FILE.exists():
-            CHAT_HISTORY_FILE.unlink()
+        session_dir = _shard_path("x", user_id, session_id).parent
+        if session_dir.exists():
+            for path in session_dir.glob("*.jsonl"):
+                path.unlink()
     else:
-        # Belirli modu temizle
-        existing_data = load_all_chat_history()
-        existing_data[mode] = []
-        
-        with open(CHAT_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-
-# get_chat_stats function removed - not used
+        _shard_path(mode, user_id, session_id).unlink(missing_ok=True)
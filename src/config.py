@@ -11,16 +11,80 @@ UPLOAD_DIRECTORY = Path(os.getenv("UPLOAD_DIRECTORY", "storage/uploads"))
 # Embeddings
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
 
+# Embedding önbelleği - (model, chunk sha256) -> vektör, yeniden indekslemede hesaplamayı atlar
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_DIR = Path(os.getenv("EMBEDDING_CACHE_DIR", "storage/embedding_cache"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # "float16" | "float32"
+
 # Chunking - Optimized for better context
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1500"))  # Daha büyük chunk = daha iyi bağlam
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "300"))  # Daha fazla overlap = daha iyi devamlılık
 
+# Dedup - yakın-tekrar chunk'lar bir kez saklanır, tüm kaynaklar referans olarak tutulur
+# (birebir tekrarlar içerikten türetilen chunk ID'leri sayesinde her zaman birleşir)
+# Yakın-tekrar birleştirme isteğe bağlıdır: sadece tutar/tarih/sözleşme no farklı chunk'lar da
+# eşiği geçer ve ikinci metin saklanmaz (şablon belgelerden oluşan korpuslarda açmayın)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))  # MinHash ile tahmini Jaccard eşiği
+DEDUP_MIN_TOKENS = int(os.getenv("DEDUP_MIN_TOKENS", "24"))  # Daha kısa chunk'larda sadece birebir eşleşme
+
+# Ingest - paralel yükleme/bölme
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))  # 1 = tek süreç, 0 = CPU sayısı kadar
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))  # Chroma'ya tek seferde yazılan chunk sayısı
+
 # Retrieval - Optimized settings
-SEARCH_TYPE = os.getenv("SEARCH_TYPE", "mmr")  # "mmr" | "similarity"
-TOP_K = int(os.getenv("TOP_K", "8"))  # Optimal: 8 chunks
-MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.6"))  # Optimal: 0.6 (balance diversity/relevance)
+SEARCH_TYPE = os.getenv("SEARCH_TYPE", "mmr")  # "mmr" | "similarity" | "hybrid"
+# TOP_K / MMR_LAMBDA / fetch_k / CHUNK_SIZE ayarı için: python benchmarks/evaluate.py (recall@k, MRR, gecikme, token)
+TOP_K = int(os.getenv("TOP_K", "8"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.6"))  # 1 = sadece alaka, 0 = en fazla çeşitlilik
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "50"))  # MMR aday sayısı (en az 5 * TOP_K)
+MMR_VECTOR_CACHE = os.getenv("MMR_VECTOR_CACHE", "true").lower() in ("1", "true", "yes")  # Chunk vektörlerini bellekte float32 matriste tut (N x boyut x 4 bayt)
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))  # Hybrid: BM25 ve vektör listelerinden alınan aday sayısı
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))  # Reciprocal Rank Fusion sabiti
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))  # Soru -> chunk id LRU (0 = kapalı)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # Soru embedding LRU (0 = kapalı)
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))  # Eşzamanlı sorguları toplama penceresi (tek sorguda beklenmez, 0 = kapalı)
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "16"))
+
+# Reranking - cross-encoder ile yeniden sıralama (opsiyonel)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # Çok dilli
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # Retriever'dan alınan aday sayısı
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))  # LLM'e gönderilen chunk sayısı
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))  # 0 = sınırsız
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # Soru + chunk için token sınırı
+
+# Bağlam paketleme - LLM'e giden CONTEXT için token bütçesi
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 = sınırsız
+
+# İzleme - aşama süreleri, kayan histogramlar, JSON log ve /metrics
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_LOG_FILE = Path(os.getenv("TRACE_LOG_FILE")) if os.getenv("TRACE_LOG_FILE") else None  # Boş = sadece logging
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1024"))  # Histogram başına tutulan son örnek sayısı
+
+# Answer cache - aynı/benzer sorular için LLM çağrısını atla
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_FILE = Path(os.getenv("ANSWER_CACHE_FILE", "storage/answer_cache.sqlite"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))  # LRU sınırı
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # Cosine benzerlik eşiği
+
+# Sohbet geçmişi - kullanıcı/oturum/mod başına append-only JSONL
+CHAT_HISTORY_DIR = Path(os.getenv("CHAT_HISTORY_DIR", "storage/chat_history"))
+CHAT_HISTORY_LOAD_LIMIT = int(os.getenv("CHAT_HISTORY_LOAD_LIMIT", "200"))  # Açılışta yüklenen son mesaj sayısı
+
+# Agent sohbet hafızası - son turlar olduğu gibi, eskileri artımlı özet olarak
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))  # Olduğu gibi gönderilen geçmiş için (tiktoken)
+HISTORY_SUMMARY_MAX_WORDS = int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", "150"))
 
 # Models
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
 DEFAULT_OPENAI_MODEL = os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" | "fake" (offline test/benchmark)
+
+# LLM bağlantı havuzu / eşzamanlılık
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # Süreç başına aynı anda LLM isteği
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))  # saniye
 
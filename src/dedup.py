@@ -0,0 +1,261 @@
+"""
+Tekrar tespit modülü - Birebir ve yakın-tekrar chunk'ların tekilleştirilmesi
+
+Bu modül şu görevleri yerine getirir:
+- Chunk metnini normalize edip içerik özeti (sha256) ile birebir tekrarları bulur
+- MinHash imzası + LSH bantları ile yakın-tekrar chunk'ları bulur (kelime 3'lüleri üzerinde Jaccard)
+- Her içeriği bir kez saklar; chunk başına tüm kaynak referanslarını (dosya, sayfa, konum) tutar
+- Kaynak silindiğinde/değiştiğinde referansları bırakır, sahipsiz kalan chunk'ları raporlar
+- Chroma metadata'sı için birincil kaynak + tüm referansları üretir
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from collections import defaultdict
+from pathlib import Path
+import base64
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from config import PERSIST_DIRECTORY, DEDUP_ENABLED, DEDUP_SIMILARITY, DEDUP_MIN_TOKENS
+
+DEDUP_FILE = PERSIST_DIRECTORY / "dedup_index.json"
+SHINGLE_SIZE = 3
+NUM_PERM = 32
+LSH_BANDS = 8  # 8 bant x 4 satır: Jaccard 0.85 için aday olma olasılığı ~%99.7
+_ROWS = NUM_PERM // LSH_BANDS
+
+_rng = np.random.default_rng(20240517)  # Sabit tohum: imzalar süreçler/çalıştırmalar arasında aynı
+_PERM_XOR = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_PERM_MUL = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+
+Ref = Tuple[str, Optional[int], Optional[int], Optional[str]]  # (source, page, start_index, doc_version)
+
+_WS_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Birebir eşleşme için metni normalize eder (boşluklar ve büyük/küçük harf).
+
+    """
+    return _WS_RE.sub(" ", text).strip().casefold()
+
+def content_hash(text: str) -> str:
+    """
+    Normalize edilmiş metnin SHA-256 özetini döndürür.
+
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def minhash(text: str) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Kelime 3'lülerinden MinHash imzası (NUM_PERM x uint32) hesaplar.
+    (imza veya None, token sayısı) döndürür.
+
+    """
+    from sparse_index import tokenize
+
+    tokens = tokenize(text)
+    if not tokens:
+        return None, 0
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # (x ^ a) * b mod 2^64 -> üst 32 bit: ucuz, yeterince bağımsız permütasyon ailesi
+    mixed = ((hashes[:, None] ^ _PERM_XOR[None, :]) * _PERM_MUL[None, :]) >> np.uint64(32)
+    return mixed.min(axis=0).astype(np.uint32), len(tokens)
+
+def _encode_sig(sig: np.ndarray) -> str:
+    return base64.b64encode(sig.astype("<u4").tobytes()).decode("ascii")
+
+def _decode_sig(raw: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(raw), dtype="<u4")
+
+def _bands(sig: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [(b, sig[b * _ROWS:(b + 1) * _ROWS].tobytes()) for b in range(LSH_BANDS)]
+
+def ref_of(metadata: Dict[str, Any]) -> Ref:
+    """
+    Chunk metadata'sından kaynak referansını çıkarır.
+
+    """
+    return (
+        str(metadata.get("source", "")), metadata.get("page"), metadata.get("start_index"),
+        metadata.get("doc_version"),
+    )
+
+class DedupIndex:
+    """
+    İçerik → chunk id kaydı (birebir + MinHash) ve chunk başına kaynak referansları.
+
+    """
+
+    def __init__(
+        self,
+        path: Path = DEDUP_FILE,
+        enabled: bool = DEDUP_ENABLED,
+        similarity: float = DEDUP_SIMILARITY,
+        min_tokens: int = DEDUP_MIN_TOKENS,
+    ) -> None:
+        self.path = Path(path)
+        self.enabled = enabled
+        self.similarity = similarity
+        self.min_tokens = min_tokens
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._sigs: Dict[str, np.ndarray] = {}
+        self._bands: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+        self._by_source: Dict[str, Set[str]] = defaultdict(set)
+        self.load()
+
+    def load(self) -> None:
+        self.entries, self._by_hash, self._sigs = {}, {}, {}
+        self._bands, self._by_source = defaultdict(set), defaultdict(set)
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+            for chunk_id, e in data.get("entries", {}).items():
+                # Eski kayıtlarda doc_version yok
+                e["refs"] = [tuple(r) + (None,) * (4 - len(r)) for r in e["refs"]]
+                self._index(chunk_id, e)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _index(self, chunk_id: str, entry: Dict[str, Any]) -> None:
+        self.entries[chunk_id] = entry
+        self._by_hash.setdefault(entry["hash"], chunk_id)
+        if entry.get("minhash"):
+            sig = _decode_sig(entry["minhash"])
+            self._sigs[chunk_id] = sig
+            for band in _bands(sig):
+                self._bands[band].add(chunk_id)
+        for ref in entry["refs"]:
+            self._by_source[ref[0]].add(chunk_id)
+
+    def _unindex(self, chunk_id: str) -> None:
+        entry = self.entries.pop(chunk_id)
+        if self._by_hash.get(entry["hash"]) == chunk_id:
+            del self._by_hash[entry["hash"]]
+        sig = self._sigs.pop(chunk_id, None)
+        if sig is not None:
+            for band in _bands(sig):
+                self._bands[band].discard(chunk_id)
+        for ref in entry["refs"]:
+            self._by_source[ref[0]].discard(chunk_id)
+
+    def match(self, text: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Metnin birebir veya (DEDUP_ENABLED ise) yakın tekrarı olan kayıtlı chunk'ı arar.
+        (eşleşen chunk id veya None, yeni kayıt için parmak izi) döndürür.
+        Referansı bırakılmış kayıtlar (ör. düzenlenen dosyanın eski sürümü) sadece birebir
+        eşleşir; aksi halde değişen chunk eski metnine bağlanır ve yeni metin hiç yazılmaz.
+
+        """
+        digest = content_hash(text)
+        sig, n_tokens = minhash(text)
+        # Kısa metinlerde MinHash güvenilir değil: sadece birebir eşleşme
+        usable = sig is not None and n_tokens >= self.min_tokens
+        fingerprint = {"hash": digest, "minhash": _encode_sig(sig) if usable else None}
+        # Birebir tekrarlar her zaman birleşir: chunk id içerikten türetilir
+        if digest in self._by_hash:
+            return self._by_hash[digest], fingerprint
+        if not self.enabled or not usable:
+            return None, fingerprint
+        candidates = sorted(set().union(*(self._bands.get(b, ()) for b in _bands(sig))))
+        best, best_sim = None, self.similarity
+        for chunk_id in candidates:
+            if not self.entries[chunk_id]["refs"]:
+                continue
+            sim = float(np.mean(self._sigs[chunk_id] == sig))  # Tahmini Jaccard benzerliği
+            if sim >= best_sim and (best is None or sim > best_sim):
+                best, best_sim = chunk_id, sim
+        return best, fingerprint
+
+    def add(self, chunk_id: str, fingerprint: Dict[str, Any], ref: Ref) -> None:
+        """
+        Yeni bir chunk'ı ilk referansıyla kaydeder.
+
+        """
+        if chunk_id in self.entries:
+            self._unindex(chunk_id)
+        self._index(chunk_id, {**fingerprint, "refs": [ref]})
+
+    def add_ref(self, chunk_id: str, ref: Ref) -> None:
+        refs = self.entries[chunk_id]["refs"]
+        if ref not in refs:
+            refs.append(ref)
+            self._by_source[ref[0]].add(chunk_id)
+
+    def source_ids(self, source: str) -> Set[str]:
+        """
+        Kaynağın referans verdiği chunk id'lerini döndürür.
+
+        """
+        return set(self._by_source.get(source, ()))
+
+    def release_source(self, source: str) -> Set[str]:
+        """
+        Kaynağa ait tüm referansları bırakır; etkilenen chunk id'lerini döndürür.
+        Referansı kalmayan kayıtlar orphans() ile toplanana kadar birebir eşleşebilir kalır,
+        böylece aynı içerik yeniden geldiğinde tekrar embed edilmez.
+
+        """
+        touched = self._by_source.pop(source, set())
+        for chunk_id in touched:
+            entry = self.entries[chunk_id]
+            entry["refs"] = [r for r in entry["refs"] if r[0] != source]
+        return touched
+
+    def orphans(self, candidates: Iterable[str]) -> List[str]:
+        """
+        Adaylar içinden hiçbir kaynağın referans vermediği chunk'ları kayıttan
+        çıkarır ve döndürür.
+
+        """
+        ids = [i for i in candidates if i in self.entries and not self.entries[i]["refs"]]
+        for chunk_id in ids:
+            self._unindex(chunk_id)
+        return ids
+
+    def metadata(self, chunk_id: str) -> Dict[str, Any]:
+        """
+        Chunk için Chroma metadata'sı: birincil kaynak + tüm referanslar (JSON).
+
+        """
+        refs = sorted(self.entries[chunk_id]["refs"], key=lambda r: (r[0], r[1] or 0, r[2] or 0))
+        source, page, start, version = refs[0]
+        # None değerler Chroma update'inde anahtarı siler (ör. birincil kaynak PDF'ten DOCX'e geçerse)
+        return {
+            "source": source, "page": page, "start_index": start, "doc_version": version,
+            "ref_count": len(refs), "refs": json.dumps(refs, ensure_ascii=False),
+        }
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.load()
+
+def parse_refs(metadata: Dict[str, Any]) -> List[Tuple[str, Optional[int]]]:
+    """
+    Metadata'daki tüm (kaynak, sayfa) referanslarını döndürür.
+
+    """
+    raw = metadata.get("refs")
+    if raw:
+        try:
+            return [(r[0], r[1]) for r in json.loads(raw)]
+        except Exception:
+            pass
+    return [(str(metadata.get("source", "unknown")), metadata.get("page"))]
@@ -0,0 +1,169 @@
+"""
+Embedding önbelleği modülü - Chunk içeriğine göre kalıcı vektör önbelleği
+
+Bu modül şu görevleri yerine getirir:
+- (model adı, chunk metninin sha256'sı) → vektör eşlemesini diskte saklar
+- Her model için tek bir append-only kayıt dosyası tutar (anahtar + float16/float32 vektör)
+- Dosyayı memory-map ile okur; anahtar → satır indeksi bellekte tutulur
+- Başka bir süreç dosyaya ekleme yaptıysa yeni kayıtları otomatik okur
+- Yeniden yüklenen / az değişen dosyalarda ve tekrar eden metinlerde (başlık, uyarı metni)
+  embedding hesaplamasını atlatır
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DTYPE
+
+KEY_BYTES = 32  # sha256
+
+def text_key(text: str) -> bytes:
+    """
+    Chunk metninin önbellek anahtarını (sha256 digest) döndürür.
+
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def _model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_") or "model"
+
+class EmbeddingStore:
+    """
+    Tek bir model için append-only, memory-mapped embedding önbelleği.
+
+    Kayıt formatı: [32 bayt sha256 | dim x float16/float32]. Anahtar ve vektör
+    tek bir write ile eklendiği için eşzamanlı yazan süreçler hizayı bozmaz;
+    yarım kalmış son kayıt (çökme) okunurken yok sayılır.
+    """
+
+    def __init__(self, model_name: str, root: Path = EMBEDDING_CACHE_DIR, dtype: str = EMBEDDING_CACHE_DTYPE) -> None:
+        self.model_name = model_name
+        self.dir = Path(root) / _model_slug(model_name)
+        self.path = self.dir / "vectors.bin"
+        self.meta_path = self.dir / "meta.json"
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._records: Optional[np.memmap] = None
+        self._rows = 0
+        self._load_meta()
+
+    def _load_meta(self) -> None:
+        if not self.meta_path.exists():
+            return
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if meta.get("model") == self.model_name and np.dtype(meta.get("dtype")) == self.dtype:
+            self.dim = int(meta["dim"])
+
+    def _init_meta(self, dim: int) -> None:
+        # Format değiştiyse (boyut/dtype) eski dosya kullanılamaz
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self.meta_path.write_text(
+            json.dumps({"model": self.model_name, "dim": dim, "dtype": self.dtype.name}), encoding="utf-8"
+        )
+        self.dim = dim
+        self._index.clear()
+        self._records = None
+        self._rows = 0
+
+    def _record_dtype(self) -> np.dtype:
+        return np.dtype([("key", f"V{KEY_BYTES}"), ("vec", self.dtype, (self.dim,))])
+
+    def _refresh(self) -> None:
+        """
+        Dosyaya eklenen yeni kayıtları anahtar indeksine ve memmap'e alır.
+
+        """
+        if self.dim is None:
+            self._load_meta()
+        if self.dim is None or not self.path.exists():
+            return
+        rec = self._record_dtype()
+        rows = self.path.stat().st_size // rec.itemsize
+        if rows == self._rows:
+            return
+        if rows < self._rows:  # Dosya başka bir süreçte yeniden oluşturuldu
+            self._index.clear()
+            self._rows = 0
+        self._records = np.memmap(self.path, dtype=rec, mode="r", shape=(rows,))
+        keys = self._records["key"]
+        for i in range(self._rows, rows):
+            self._index.setdefault(keys[i].tobytes(), i)
+        self._rows = rows
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[List[float]]]:
+        """
+        Anahtarların vektörlerini döndürür; önbellekte olmayanlar için None.
+
+        """
+        with self._lock:
+            self._refresh()
+            if self._records is None:
+                return [None] * len(keys)
+            rows = [self._index.get(k) for k in keys]
+            hit = [i for i, r in enumerate(rows) if r is not None]
+            out: List[Optional[List[float]]] = [None] * len(keys)
+            if hit:
+                vecs = self._records["vec"][[rows[i] for i in hit]].astype(np.float32)
+                for i, vec in zip(hit, vecs):
+                    out[i] = vec.tolist()
+            return out
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]) -> None:
+        """
+        Yeni vektörleri dosyanın sonuna ekler.
+
+        """
+        if not keys:
+            return
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim != arr.shape[1]:
+                self._init_meta(arr.shape[1])
+            self._refresh()
+            fresh = [i for i, k in enumerate(keys) if k not in self._index]
+            if not fresh:
+                return
+            records = np.empty(len(fresh), dtype=self._record_dtype())
+            records["key"] = [np.void(keys[i]) for i in fresh]
+            records["vec"] = arr[fresh].astype(self.dtype)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0))
+            try:
+                os.write(fd, records.tobytes())
+            finally:
+                os.close(fd)
+            self._refresh()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+_STORES_LOCK = threading.Lock()
+_STORES: Dict[str, EmbeddingStore] = {}
+
+def get_embedding_store(model_name: str) -> EmbeddingStore:
+    """
+    Model için süreç genelinde paylaşılan önbelleği döndürür.
+
+    """
+    with _STORES_LOCK:
+        store = _STORES.get(model_name)
+        if store is None:
+            store = EmbeddingStore(model_name)
+            _STORES[model_name] = store
+        return store
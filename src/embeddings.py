@@ -0,0 +1,330 @@
+"""
+Embedding modülü - Süreç genelinde paylaşılan embedding modeli
+
+Bu modül şu görevleri yerine getirir:
+- Embedding modelini süreç başına bir kez yükler ve ısındırır (warm-up)
+- İndeksleme, retrieval ve agent aracı için aynı modeli paylaştırır (thread-safe)
+- Model yükleme süresini ölçer
+- EMBEDDING_MODEL_NAME değiştiğinde modeli yeniden yükler (hot-swap)
+- Sorgu embedding'lerini sınırlı bir LRU önbellekte tutar
+- Eşzamanlı embed_query çağrılarını kısa bir pencerede toplayıp tek batch'te embed eder
+- Doküman embedding'lerini chunk içeriğine göre kalıcı önbellekten okur (embedding_cache)
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_MODEL_NAME, QUERY_EMBEDDING_CACHE_SIZE, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE,
+    EMBEDDING_CACHE_ENABLED,
+)
+from tracing import span
+
+_SHARED_LOCK = threading.Lock()
+_SHARED: Optional["SharedEmbeddings"] = None
+
+def _configured_model_name() -> str:
+    """
+    Ortamdaki güncel embedding model adını döndürür.
+
+    """
+    return os.getenv("EMBEDDING_MODEL_NAME", EMBEDDING_MODEL_NAME)
+
+def _load_model(model_name: str) -> Embeddings:
+    """
+    HuggingFace embedding modelini yükler.
+    "fake" / "fake-<boyut>" adları ağ gerektirmeyen deterministik bir model verir (test/benchmark).
+
+    """
+    if model_name.startswith("fake"):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        size = int(model_name.split("-", 1)[1]) if "-" in model_name else 384
+        return DeterministicFakeEmbedding(size=size)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    # Force CPU device to avoid GPU/meta-tensor issues on some Windows setups
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+class _QueryBatcher:
+    """
+    embed_query çağrılarını arka plandaki tek bir worker thread'de toplar.
+    İlk istek geldikten sonra window_ms boyunca (veya max_size dolana kadar)
+    gelen sorgular tek forward pass ile embed edilir ve her bekleyene kendi
+    vektörü döndürülür. Başka bekleyen sorgu yoksa (tek kullanıcı) pencere
+    beklenmeden hemen embed edilir.
+
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_size: int = QUERY_BATCH_MAX_SIZE,
+    ) -> None:
+        self._embed_fn = embed_fn
+        self.window = window_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._active = 0  # submit() içinde sonucunu bekleyen çağrı sayısı
+        self._active_lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            "batches": 0, "queries": 0, "max_batch": 0, "wait_ms_total": 0.0, "max_wait_ms": 0.0,
+        }
+
+    def submit(self, text: str) -> List[float]:
+        """
+        Sorguyu kuyruğa ekler ve batch'i işlenene kadar bekler.
+
+        """
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    # Thread tembel başlatılır: import sırasında/fork öncesinde thread açılmaz
+                    self._thread = threading.Thread(target=self._worker, name="query-embed-batcher", daemon=True)
+                    self._thread.start()
+        fut: Future = Future()
+        with self._active_lock:
+            self._active += 1
+        try:
+            self._queue.put((text, fut, time.perf_counter()))
+            return fut.result()
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def _worker(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            if self._active <= 1:
+                self._run(batch)  # Eşzamanlı başka sorgu yok: pencere sadece gecikme ekler
+                continue
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = dict(zip(texts, self._embed_fn(texts)))
+        except Exception as e:
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+
+        waits = [(started - queued) * 1000 for _, _, queued in batch]
+        self.stats["batches"] += 1
+        self.stats["queries"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        self.stats["wait_ms_total"] += sum(waits)
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], max(waits))
+        for text, fut, _ in batch:
+            fut.set_result(vectors[text])
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Batch boyutu ve kuyrukta bekleme metriklerini döndürür.
+
+        """
+        st = dict(self.stats)
+        return {
+            "query_batches": st["batches"],
+            "query_batch_avg": round(st["queries"] / st["batches"], 2) if st["batches"] else None,
+            "query_batch_max": st["max_batch"],
+            "query_wait_avg_ms": round(st["wait_ms_total"] / st["queries"], 2) if st["queries"] else None,
+            "query_wait_max_ms": round(st["max_wait_ms"], 2),
+        }
+
+class SharedEmbeddings(Embeddings):
+    """
+    Süreç genelinde paylaşılan, hot-swap edilebilir embedding modeli.
+
+    Chroma ve retriever'lar bu nesneyi tutar; model değiştiğinde aynı nesne
+    yeni modele yönlenir. Farklı boyutlu bir modele geçildiğinde koleksiyonun
+    yeniden indekslenmesi gerekir.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._model: Optional[Embeddings] = None
+        self._pinned_name: Optional[str] = None
+        self.model_name: Optional[str] = None
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self.stats: Dict[str, Any] = {
+            "model_name": None,
+            "load_seconds": None,
+            "warmup_seconds": None,
+            "loads": 0,
+            "query_cache_hits": 0,
+            "query_cache_misses": 0,
+            "doc_cache_hits": 0,
+            "doc_cache_misses": 0,
+        }
+        self._batcher = _QueryBatcher(self.embed_queries) if QUERY_BATCH_WINDOW_MS > 0 else None
+
+    def load(self, model_name: Optional[str] = None) -> Embeddings:
+        """
+        Modeli yükler, dummy encode ile ısındırır ve aktif model yapar.
+
+        """
+        with self._lock:
+            self._pinned_name = model_name
+            return self._load_locked(model_name or _configured_model_name())
+
+    def _load_locked(self, name: str) -> Embeddings:
+        t0 = time.perf_counter()
+        model = _load_model(name)
+        t1 = time.perf_counter()
+        # Warm-up: ilk encode'daki tokenizer/graph kurulum maliyetini öne çek
+        model.embed_query("warmup")
+        t2 = time.perf_counter()
+
+        self._model = model
+        self.model_name = name
+        with self._query_cache_lock:
+            self._query_cache.clear()
+        self.stats.update(
+            model_name=name,
+            load_seconds=round(t1 - t0, 3),
+            warmup_seconds=round(t2 - t1, 3),
+            loads=self.stats["loads"] + 1,
+        )
+        return model
+
+    def _get_model(self) -> Embeddings:
+        """
+        Aktif modeli döndürür; model adı değiştiyse yeniden yükler.
+
+        """
+        model = self._model
+        if model is not None and self.model_name == (self._pinned_name or _configured_model_name()):
+            return model
+        with self._lock:
+            wanted = self._pinned_name or _configured_model_name()
+            if self._model is None or self.model_name != wanted:
+                self._load_locked(wanted)
+            return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Dokümanları embed eder. Önbellekte (model, metin sha256) karşılığı olanlar
+        hesaplanmaz; aynı çağrıdaki tekrar eden metinler bir kez embed edilir.
+
+        """
+        model = self._get_model()
+        if not EMBEDDING_CACHE_ENABLED or not texts:
+            with span("embed.documents", texts=len(texts)):
+                return model.embed_documents(texts)
+
+        from embedding_cache import get_embedding_store, text_key
+
+        store = get_embedding_store(self.model_name)
+        keys = [text_key(t) for t in texts]
+        vectors = store.get_many(keys)
+        missing: Dict[bytes, str] = {}
+        for key, text, vec in zip(keys, texts, vectors):
+            if vec is None:
+                missing.setdefault(key, text)
+        self.stats["doc_cache_hits"] += len(texts) - sum(v is None for v in vectors)
+        self.stats["doc_cache_misses"] += len(missing)
+        if missing:
+            new_keys = list(missing)
+            with span("embed.documents", texts=len(new_keys)):
+                new_vectors = model.embed_documents([missing[k] for k in new_keys])
+            if model is self._model:
+                store.put_many(new_keys, new_vectors)
+            fresh = dict(zip(new_keys, new_vectors))
+            vectors = [vec if vec is not None else fresh[key] for key, vec in zip(keys, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        model = self._get_model()
+        with self._query_cache_lock:
+            vec = self._query_cache.get(text)
+            if vec is not None:
+                self._query_cache.move_to_end(text)
+                self.stats["query_cache_hits"] += 1
+                return vec
+            self.stats["query_cache_misses"] += 1
+        with span("embed.query"):
+            if self._batcher is not None:
+                return self._batcher.submit(text)  # embed_queries önbelleğe de yazar
+            vec = model.embed_query(text)
+        if QUERY_EMBEDDING_CACHE_SIZE > 0 and model is self._model:
+            with self._query_cache_lock:
+                self._query_cache[text] = vec
+                while len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return vec
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Birden fazla sorguyu tek forward pass'te embed eder ve sorgu önbelleğine yazar.
+        Sorgu talimatı (query instruction) kullanılmadığı için embed_query ile aynı sonucu verir.
+
+        """
+        model = self._get_model()
+        vectors = model.embed_documents(texts)
+        if QUERY_EMBEDDING_CACHE_SIZE > 0 and model is self._model:
+            with self._query_cache_lock:
+                for text, vec in zip(texts, vectors):
+                    self._query_cache[text] = vec
+                    self._query_cache.move_to_end(text)
+                while len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        return vectors
+
+def get_embeddings() -> SharedEmbeddings:
+    """
+    Paylaşılan embedding modelini döndürür (ilk çağrıda yükler).
+
+    """
+    global _SHARED
+    if _SHARED is None:
+        with _SHARED_LOCK:
+            if _SHARED is None:
+                _SHARED = SharedEmbeddings()
+    return _SHARED
+
+def reload_embeddings(model_name: Optional[str] = None) -> SharedEmbeddings:
+    """
+    Embedding modelini zorla yeniden yükler (hot-swap).
+
+    """
+    shared = get_embeddings()
+    shared.load(model_name)
+    return shared
+
+def get_embedding_stats() -> Dict[str, Any]:
+    """
+    Model yükleme, sorgu önbelleği ve sorgu batch'leme metriklerini döndürür.
+
+    """
+    shared = get_embeddings()
+    stats = dict(shared.stats)
+    if shared._batcher is not None:
+        stats.update(shared._batcher.report())
+    return stats
@@ -0,0 +1,161 @@
+"""
+Sohbet hafızası modülü - Agent için geçmiş penceresi ve özetleme
+
+Bu modül şu görevleri yerine getirir:
+- Son N turu token bütçesi içinde (tiktoken ile ölçerek) olduğu gibi tutar
+- Pencereden çıkan eski turları artımlı olarak güncellenen bir özete katar
+- Her turda sadece yeni çıkan mesajları özetler (tüm geçmişi tekrar özetlemez)
+- Gönderilmeyen geçmişin kazandırdığı token sayısını raporlar
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from config import (
+    DEFAULT_OPENAI_MODEL, HISTORY_MAX_TURNS, HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MAX_WORDS,
+)
+
+SUMMARY_PROMPT = """Aşağıda bir kullanıcı ile bilgi tabanı asistanı arasındaki konuşmanın mevcut özeti ve
+özete henüz eklenmemiş mesajlar var. Özeti yeni mesajlarla güncelle.
+- Kullanıcının sorularını, ulaşılan cevapları, sayıları ve kaynak adlarını koru
+- En fazla {max_words} kelime, Türkçe, madde işaretleri kullan
+- Sadece güncellenmiş özeti yaz
+
+MEVCUT ÖZET:
+{summary}
+
+YENİ MESAJLAR:
+{messages}
+"""
+
+@lru_cache(maxsize=8)
+def _encoding(model_name: str):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None  # tiktoken yok / BPE dosyası indirilemedi (offline)
+
+@lru_cache(maxsize=4096)
+def text_tokens(text: str, model_name: str = DEFAULT_OPENAI_MODEL) -> int:
+    """
+    Metnin token sayısını döndürür (tiktoken yoksa yaklaşık).
+
+    """
+    enc = _encoding(model_name)
+    if enc is None:
+        return len(text) // 4 + 1  # Kaba tahmin: ~4 karakter / token
+    return len(enc.encode(text))
+
+def count_tokens(messages: List[BaseMessage], model_name: str = DEFAULT_OPENAI_MODEL) -> int:
+    """
+    Mesaj listesinin yaklaşık prompt token sayısını döndürür (mesaj başına 4 token ek yük).
+
+    """
+    return sum(text_tokens(str(m.content), model_name) + 4 for m in messages)
+
+def _render(messages: List[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        role = "Kullanıcı" if isinstance(m, HumanMessage) else "Asistan"
+        lines.append(f"{role}: {m.content}")
+    return "\n".join(lines)
+
+class ConversationMemory:
+    """
+    Bir sohbetin agent'a gönderilecek geçmişini hazırlar.
+
+    Geçmiş listesi sadece sonuna ekleme yapılarak büyür; özet, listenin ilk
+    `summarized` mesajını kapsar. llm verilmezse pencere dışındaki mesajlar
+    özetlenmeden atlanır.
+    """
+
+    def __init__(
+        self,
+        llm: Any = None,
+        max_turns: int = HISTORY_MAX_TURNS,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        model_name: str = DEFAULT_OPENAI_MODEL,
+    ) -> None:
+        self.llm = llm
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.model_name = model_name
+        self.summary = ""
+        self.summarized = 0
+
+    def reset(self) -> None:
+        self.summary = ""
+        self.summarized = 0
+
+    def _window_start(self, history: List[BaseMessage]) -> int:
+        """
+        Bütçeye sığan son turların başladığı indeksi bulur (tur = kullanıcı mesajı + cevabı).
+
+        """
+        start, used, turns = len(history), 0, 0
+        i = len(history)
+        while i > 0 and turns < self.max_turns:
+            # Turun başı: geriye doğru ilk kullanıcı mesajı
+            j = i - 1
+            while j > 0 and not isinstance(history[j], HumanMessage):
+                j -= 1
+            cost = count_tokens(history[j:i], self.model_name)
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            turns += 1
+            start = i = j
+        return start
+
+    def _fold(self, messages: List[BaseMessage], callbacks: Optional[List] = None) -> bool:
+        """
+        Yeni mesajları LLM ile mevcut özete katar.
+
+        """
+        prompt = SUMMARY_PROMPT.format(
+            max_words=HISTORY_SUMMARY_MAX_WORDS,
+            summary=self.summary or "(henüz yok)",
+            messages=_render(messages),
+        )
+        try:
+            result = self.llm.invoke([HumanMessage(content=prompt)], config={"callbacks": callbacks or []})
+        except Exception:
+            return False  # Özetleme başarısızsa bir sonraki turda tekrar denenir
+        self.summary = str(result.content).strip()
+        return True
+
+    def prepare(
+        self, history: List[BaseMessage], callbacks: Optional[List] = None
+    ) -> Tuple[List[BaseMessage], Dict[str, int]]:
+        """
+        Agent'a gönderilecek mesajları (özet + son turlar) ve token bilgisini döndürür.
+        Özetleme çağrısının token'ları callbacks üzerinden sayılır.
+
+        """
+        history = [m for m in history if isinstance(m, (HumanMessage, AIMessage))]
+        if self.summarized > len(history):  # Geçmiş temizlendi
+            self.reset()
+
+        start = self._window_start(history)
+        if self.llm is not None and start > self.summarized:
+            if self._fold(history[self.summarized:start], callbacks):
+                self.summarized = start
+
+        messages: List[BaseMessage] = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"Önceki konuşmanın özeti:\n{self.summary}"))
+        messages.extend(history[start:])
+
+        full = count_tokens(history, self.model_name)
+        sent = count_tokens(messages, self.model_name)
+        return messages, {
+            "history_tokens": sent,
+            "history_tokens_saved": max(0, full - sent),
+        }
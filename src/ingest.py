@@ -4,36 +4,57 @@ Doküman yükleme ve indeksleme modülü
 Bu modül şu görevleri yerine getirir:
 - PDF ve DOCX dosyalarını yükler
 - Dokümanları chunk'lara böler (RecursiveCharacterTextSplitter)
-- Embeddings oluşturur (sentence-transformers/all-MiniLM-L6-v2 modeli)
+- Paylaşılan embedding modelini kullanır (sentence-transformers/all-MiniLM-L6-v2 modeli)
 - ChromaDB'ye indeksler (hafif ve hızlı model)
+- Dosya manifest'i ile sadece yeni/değişen dosyaları yeniden indeksler
+- Yükleme ve bölme işini process pool'a dağıtır (INGEST_WORKERS)
+- Chunk'ları sabit boyutlu batch'ler halinde embed edip Chroma'ya yazar (devam ettirilebilir)
+- Hybrid arama için BM25 indeksini Chroma ile birlikte günceller
+- Birebir / yakın-tekrar chunk'ları bir kez saklar, tüm kaynaklarını referans olarak tutar
+- Tek bir dosyanın chunk'larını tüm indeksi sıfırlamadan siler (delete_source)
+- Yükleme, bölme, tekilleştirme ve yazma aşamalarının sürelerini ölçer (tracing)
+- İndekslemeyi süreçler arası bir dosya kilidiyle sıraya sokar (birden fazla worker/uygulama)
 """
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import hashlib
+import json
+import multiprocessing
+import os
+import time
 
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from filelock import FileLock
 
 from config import (
     PERSIST_DIRECTORY, UPLOAD_DIRECTORY,
-    EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
+    CHUNK_SIZE, CHUNK_OVERLAP, INGEST_WORKERS, EMBED_BATCH_SIZE
 )
-from rag_chain import ensure_dirs
+from embeddings import get_embeddings
+from sparse_index import get_sparse_index
+from dedup import DedupIndex, content_hash, ref_of
+from rag_chain import ensure_dirs, bump_index_version
+from tracing import span, record_stage
 
 ALLOWED_EXTS = {".pdf", ".docx"}
+MANIFEST_FILE = PERSIST_DIRECTORY / "index_manifest.json"
+CHECKPOINT_FILE = PERSIST_DIRECTORY / "ingest_checkpoint.json"
+INGEST_LOCK_FILE = PERSIST_DIRECTORY / "ingest.lock"
 
 def _doc_id(doc: Document) -> str:
     """
-    Doküman için benzersiz ID oluşturur (tekrar önleme).
+    Chunk ID'sini içerikten türetir (normalize edilmiş metnin SHA-256'sı).
+    Aynı içerik dosya adı/konumundan bağımsız olarak hep aynı ID'yi alır;
+    içerik değişince ID de değişir, böylece eski vektör yerinde kalmaz.
     
     """
-    meta = doc.metadata or {}
-    base = f"{meta.get('source','')}-{meta.get('page','')}-{meta.get('start_index','')}-{len(doc.page_content)}"
-    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+    return content_hash(doc.page_content)
 
 def _load_single_file(path: Path) -> List[Document]:
     """
@@ -59,14 +80,12 @@ def _load_single_file(path: Path) -> List[Document]:
 
 def load_documents(paths: List[Path]) -> List[Document]:
     """
-    Birden fazla dosyayı yükler.
+    Birden fazla dosyayı yükler (hatalı dosyalar atlanır).
     
     """
     docs: List[Document] = []
-    for p in paths:
-        if p.suffix.lower() not in ALLOWED_EXTS:
-            continue
-        docs.extend(_load_single_file(p))
+    for _, file_docs, _, _, _ in iter_processed_files(paths, split=False):
+        docs.extend(file_docs)
     return docs
 
 def split_documents(docs: List[Document]) -> List[Document]:
@@ -86,54 +105,412 @@ def split_documents(docs: List[Document]) -> List[Document]:
         c.metadata.setdefault("source", c.metadata.get("source", ""))
     return chunks
 
-def get_embeddings():
+def _process_file(
+    path_str: str, split: bool = True
+) -> Tuple[str, List[Document], int, Optional[str], Dict[str, float]]:
+    """
+    Tek dosyayı yükler ve (istenirse) chunk'lar; worker process'te çalışır.
+    Hata fırlatmak yerine hata mesajını döndürür, böylece bozuk bir dosya
+    tüm batch'i durdurmaz. Aşama süreleri (saniye) ana süreçte kaydedilmek
+    üzere döndürülür.
+    
     """
-    Embedding modeli oluşturur 
+    timings: Dict[str, float] = {}
+    try:
+        t0 = time.perf_counter()
+        raw_docs = _load_single_file(Path(path_str))
+        timings["load"] = time.perf_counter() - t0
+        docs = raw_docs
+        if split:
+            t0 = time.perf_counter()
+            docs = split_documents(raw_docs)
+            timings["split"] = time.perf_counter() - t0
+        return path_str, docs, len(raw_docs), None, timings
+    except Exception as e:
+        return path_str, [], 0, f"{type(e).__name__}: {e}", timings
 
+def iter_processed_files(
+    paths: List[Path], split: bool = True, workers: int = INGEST_WORKERS
+) -> Iterator[Tuple[str, List[Document], int, Optional[str], Dict[str, float]]]:
     """
-    # Force CPU device to avoid GPU/meta-tensor issues on some Windows setups
-    return HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={"device": "cpu"},
-        encode_kwargs={"normalize_embeddings": True},
-    )
+    Dosyaları yükleyip chunk'lar; sonuçları dosya sırasıyla üretir.
+    workers > 1 ise işi process pool'a dağıtır. Aynı anda en fazla
+    2 * workers dosyanın sonucu bellekte tutulur.
+    
+    """
+    paths = [p for p in paths if p.suffix.lower() in ALLOWED_EXTS]
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        for p in paths:
+            yield _process_file(str(p), split)
+        return
 
-def get_vectorstore(embedding=None) -> Chroma:
+    # spawn: torch/tokenizer thread'leri olan bir süreci fork'lamak kilitlenebilir
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        remaining = iter(paths)
+        pending = deque()
+        for p in remaining:
+            pending.append(pool.submit(_process_file, str(p), split))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            result = pending.popleft().result()
+            nxt = next(remaining, None)
+            if nxt is not None:
+                pending.append(pool.submit(_process_file, str(nxt), split))
+            yield result
+
+def get_vectorstore(embedding=None, reload: bool = False) -> Chroma:
     """
     ChromaDB vector store'u oluşturur veya yükler.
+    Embedding modeli süreç genelinde paylaşılır; her çağrıda yeniden yüklenmez.
+
+    Chroma, HNSW indeksini süreç belleğinde tutar ve başka bir sürecin eklediği
+    vektörleri aramada görmez. reload=True süreçteki Chroma client önbelleğini
+    bırakıp indeksi diskten yeniden açar; eski vector store nesneleri eski
+    haliyle çalışmaya devam eder.
     
     """
     emb = embedding or get_embeddings()
     ensure_dirs(PERSIST_DIRECTORY)
+    if reload:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
     return Chroma(
         collection_name="knowledge_base",
         embedding_function=emb,
         persist_directory=str(PERSIST_DIRECTORY),
     )
 
-def index_files(file_paths: List[Path]) -> Tuple[int, int]:
+def ingest_lock() -> FileLock:
+    """
+    İndeksi değiştiren işlemleri (index_files, delete_source, reset_vectorstore)
+    süreçler arasında sıraya sokan dosya kilidi. Manifest, tekrar kaydı,
+    checkpoint ve BM25 segment numaraları aynı anda iki yazıcı tarafından
+    güncellenmez.
+
+    """
+    ensure_dirs(PERSIST_DIRECTORY)
+    return FileLock(str(INGEST_LOCK_FILE))
+
+def _file_sha256(path: Path) -> str:
+    """
+    Dosya içeriğinin SHA-256 özetini hesaplar (parça parça okuyarak).
+    
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest() -> Dict[str, Dict]:
+    """
+    İndekslenmiş dosyaların manifest'ini yükler (path -> size, mtime, sha256, chunk_ids).
+    
+    """
+    if not MANIFEST_FILE.exists():
+        return {}
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_manifest(manifest: Dict[str, Dict]) -> None:
+    """
+    Manifest'i atomik olarak diske yazar.
+    
+    """
+    _write_json_atomic(MANIFEST_FILE, manifest)
+
+def _write_json_atomic(path: Path, data: Any) -> None:
+    """
+    JSON verisini geçici dosya + rename ile atomik olarak yazar.
+    
+    """
+    ensure_dirs(path.parent)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _load_checkpoint() -> Dict[str, Any]:
+    """
+    Yarım kalmış dosyanın checkpoint'ini yükler (path, sha256, committed).
+    
+    """
+    if not CHECKPOINT_FILE.exists():
+        return {}
+    try:
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _iter_batches(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Listeyi sabit boyutlu parçalara böler.
+    
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _sync_refs(vs: Chroma, sparse: Any, dedup: DedupIndex, touched: Iterable[str], batch_size: int) -> int:
+    """
+    Referansları değişen chunk'ların metadata'sını günceller; hiçbir kaynağın
+    referans vermediği chunk'ları Chroma ve BM25 indeksinden siler.
+    Silinen chunk sayısını döndürür.
+    
+    """
+    touched = list(touched)
+    orphans = dedup.orphans(touched)
+    for batch_ids in _iter_batches(orphans, batch_size):
+        vs.delete(ids=batch_ids)
+    sparse.remove(orphans)
+    alive = [i for i in touched if i in dedup.entries]
+    for batch_ids in _iter_batches(alive, batch_size):
+        vs._collection.update(ids=batch_ids, metadatas=[dedup.metadata(i) for i in batch_ids])
+    return len(orphans)
+
+def index_files(
+    file_paths: List[Path],
+    progress_callback: Optional[Callable[[Dict[str, int]], None]] = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+) -> Dict[str, Any]:
     """
     Dosyaları yükler, chunk'lar ve ChromaDB'e indeksler.
+    Sadece yeni veya içeriği değişen dosyalar işlenir; diskten silinmiş
+    dosyaların chunk'ları koleksiyondan kaldırılır. Yüklenemeyen dosyalar
+    'errors' altında raporlanır.
+
+    Chunk'lar batch_size'lık parçalar halinde embed edilip yazılır; her
+    batch'ten sonra checkpoint güncellenir ve progress_callback
+    {"files_done", "files_total", "chunks_done"} ile çağrılır. Yarıda kesilen
+    bir indeksleme tekrar çağrıldığında son yazılan batch'ten devam eder.
+
+    Daha önce saklanmış bir chunk'ın birebir / yakın tekrarı olan chunk'lar
+    yeniden yazılmaz; mevcut chunk'a kaynak referansı olarak eklenir
+    ('deduplicated' sayacı).
     
     """
-    raw_docs = load_documents(file_paths)
-    chunks = split_documents(raw_docs)
+    with ingest_lock(), span("ingest", files=len(file_paths)) as root:
+        stats = _index_files(file_paths, progress_callback, batch_size)
+        root.set(documents=stats["documents"], chunks=stats["chunks"], stats=stats)
+        return stats
 
+def _index_files(
+    file_paths: List[Path],
+    progress_callback: Optional[Callable[[Dict[str, int]], None]],
+    batch_size: int,
+) -> Dict[str, Any]:
+    manifest = load_manifest()
+    checkpoint = _load_checkpoint()
+    stats: Dict[str, Any] = {
+        "documents": 0, "chunks": 0, "skipped": 0, "added": 0,
+        "updated": 0, "deleted": 0, "failed": 0, "deduplicated": 0, "errors": {},
+    }
     vs = get_vectorstore()
-    # Add with deterministic IDs to avoid duplicates
-    ids = [_doc_id(c) for c in chunks]
-    vs.add_documents(chunks, ids=ids)
-    # Persist is automatic in newer ChromaDB versions
+    sparse = get_sparse_index()
+    dedup = DedupIndex()
+
+    # Diskten silinmiş dosyaların referanslarını bırak. Sahipsiz kalan chunk'lar en sonda
+    # silinir; böylece yeniden adlandırılan/taşınan dosyalar mevcut chunk'lara bağlanır.
+    released = {i for i, e in dedup.entries.items() if not e["refs"]}  # Yarım kalmış önceki çalışma
+    for key in [k for k in manifest if not Path(k).exists()]:
+        old_ids = manifest.pop(key).get("chunk_ids", [])
+        released |= dedup.release_source(key)
+        # Tekilleştirme öncesi indekslenmiş (kayıtta olmayan) chunk'lar
+        legacy = [i for i in old_ids if i not in dedup.entries]
+        for batch_ids in _iter_batches(legacy, batch_size):
+            vs.delete(ids=batch_ids)
+        sparse.remove(legacy)
+        stats["deleted"] += 1
+
+    to_process: List[Path] = []
+    file_info: Dict[str, Tuple[int, float, str]] = {}
+    with span("ingest.scan"):
+        for path in file_paths:
+            if path.suffix.lower() not in ALLOWED_EXTS:
+                continue
+            key = str(path)
+            st = path.stat()
+            entry = manifest.get(key)
+
+            # Hızlı yol: boyut ve mtime aynıysa hash hesaplamaya gerek yok
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                stats["skipped"] += 1
+                continue
+            digest = _file_sha256(path)
+            if entry and entry["sha256"] == digest:
+                entry.update(size=st.st_size, mtime=st.st_mtime)
+                stats["skipped"] += 1
+                continue
+            to_process.append(path)
+            file_info[key] = (st.st_size, st.st_mtime, digest)
+
+    progress = {"files_done": 0, "files_total": len(to_process), "chunks_done": 0}
+    if progress_callback:
+        progress_callback(dict(progress))
+
+    for key, chunks, n_raw, error, timings in iter_processed_files(to_process):
+        if "load" in timings:
+            record_stage("ingest.load", timings["load"], pages=n_raw)
+        if "split" in timings:
+            record_stage("ingest.split", timings["split"], chunks=len(chunks))
+        if error is not None:
+            stats["failed"] += 1
+            stats["errors"][key] = error
+            progress["files_done"] += 1
+            if progress_callback:
+                progress_callback(dict(progress))
+            continue
+        size, mtime, digest = file_info[key]
+
+        # Eski sürümün referanslarını bırak; aynı içerik tekrar gelirse mevcut chunk'a bağlanır
+        touched = dedup.release_source(key)
+        ids: List[str] = []
+        new_chunks: List[Document] = []
+        new_ids: List[str] = []
+        with span("ingest.dedup", chunks=len(chunks)):
+            for c in chunks:
+                c.metadata["doc_version"] = digest
+                ref = ref_of(c.metadata)
+                match, fingerprint = dedup.match(c.page_content)
+                if match is None:
+                    chunk_id = _doc_id(c)
+                    dedup.add(chunk_id, fingerprint, ref)
+                    new_chunks.append(c)
+                    new_ids.append(chunk_id)
+                else:
+                    if dedup.entries[match]["refs"]:
+                        stats["deduplicated"] += 1
+                    dedup.add_ref(match, ref)
+                    chunk_id = match
+                touched.add(chunk_id)
+                ids.append(chunk_id)
+        for c, chunk_id in zip(new_chunks, new_ids):
+            meta = dedup.metadata(chunk_id)
+            c.metadata.update({k: v for k, v in meta.items() if v is not None})
+
+        # Aynı dosya sürümü için yarım kalmış indeksleme varsa yazılmış batch'leri atla
+        # (Kayıt dosya sonunda yazıldığı için eşleştirme tekrar çalıştırıldığında aynı sonucu verir)
+        committed = 0
+        if checkpoint.get("path") == key and checkpoint.get("sha256") == digest:
+            committed = min(int(checkpoint.get("committed", 0)), len(new_chunks))
+            # BM25 indeksi dosya sonunda kaydedilir; yazılmış batch'leri ona yeniden ekle
+            sparse.add(new_ids[:committed], [c.page_content for c in new_chunks[:committed]])
+
+        for start in range(committed, len(new_chunks), batch_size):
+            batch = new_chunks[start:start + batch_size]
+            # Add with deterministic IDs (upsert) to avoid duplicates; embed süresi "embed.documents" altında
+            with span("ingest.write", chunks=len(batch)):
+                vs.add_documents(batch, ids=new_ids[start:start + batch_size])
+                sparse.add(new_ids[start:start + batch_size], [c.page_content for c in batch])
+            # Persist is automatic in newer ChromaDB versions
+            checkpoint = {"path": key, "sha256": digest, "committed": start + len(batch)}
+            _write_json_atomic(CHECKPOINT_FILE, checkpoint)
+            progress["chunks_done"] += len(batch)
+            if progress_callback:
+                progress_callback(dict(progress))
+
+        entry = manifest.get(key)
+        legacy = [i for i in entry.get("chunk_ids", []) if i not in dedup.entries] if entry else []
+        # Referansı değişen mevcut chunk'ları güncelle, sahipsiz kalanları sil
+        with span("ingest.sync_refs"):
+            _sync_refs(vs, sparse, dedup, touched - set(new_ids), batch_size)
+        if entry:
+            for batch_ids in _iter_batches(legacy, batch_size):
+                vs.delete(ids=batch_ids)
+            sparse.remove(legacy)
+            stats["updated"] += 1
+        else:
+            stats["added"] += 1
+
+        manifest[key] = {
+            "size": size,
+            "mtime": mtime,
+            "sha256": digest,
+            "chunk_ids": list(dict.fromkeys(ids)),
+        }
+        with span("ingest.save"):
+            sparse.save()
+            dedup.save()
+            _save_manifest(manifest)
+        CHECKPOINT_FILE.unlink(missing_ok=True)
+        checkpoint = {}
+
+        stats["documents"] += n_raw
+        stats["chunks"] += len(chunks)
+        progress["files_done"] += 1
+        if progress_callback:
+            progress_callback(dict(progress))
+
+    if released:
+        with span("ingest.sync_refs"):
+            _sync_refs(vs, sparse, dedup, released, batch_size)
+        sparse.save()
+        dedup.save()
+    _save_manifest(manifest)
+    if stats["added"] or stats["updated"] or stats["deleted"]:
+        # Koleksiyon değişti: cevap/retrieval önbellekleri geçersizleşsin
+        bump_index_version()
+    return stats
+
+def delete_source(path: Path) -> Dict[str, int]:
+    """
+    Bir dosyanın tüm chunk'larını koleksiyondan ve BM25 indeksinden kaldırır
+    (tam sıfırlama yapmadan). Başka dosyaların da referans verdiği chunk'lar
+    silinmez, sadece o dosyanın referansı çıkarılır. Maliyet dosyanın chunk
+    sayısıyla orantılıdır. Dosyanın kendisi silinmez.
     
-    return len(raw_docs), len(chunks)
+    """
+    with ingest_lock():
+        return _delete_source(str(path))
+
+def _delete_source(key: str) -> Dict[str, int]:
+    manifest = load_manifest()
+    vs = get_vectorstore()
+    sparse = get_sparse_index()
+    dedup = DedupIndex()
+
+    old_ids = manifest.pop(key, {}).get("chunk_ids", [])
+    # Kayıtta olmayan (tekilleştirme öncesi) chunk'lar: tek bir metadata filtreli silme
+    legacy = [i for i in old_ids if i not in dedup.entries]
+    released = dedup.release_source(key)
+    removed = _sync_refs(vs, sparse, dedup, released, EMBED_BATCH_SIZE)
+    if legacy:
+        vs._collection.delete(where={"source": key})
+        sparse.remove(legacy)
+
+    sparse.save()
+    dedup.save()
+    _save_manifest(manifest)
+    if released or legacy:
+        bump_index_version()
+    return {"deleted": removed + len(legacy), "shared": len(released) - removed}
 
 def reset_vectorstore():
     """
-    Tüm indekslenmiş veriyi siler (ChromaDB).
+    Tüm indekslenmiş veriyi siler (ChromaDB + BM25 indeksi + tekrar kaydı).
     
     """
     # Danger: deletes all persisted data
     import shutil
-    if PERSIST_DIRECTORY.exists():
-        shutil.rmtree(PERSIST_DIRECTORY)
-    ensure_dirs(PERSIST_DIRECTORY)
+    from chromadb.api.client import SharedSystemClient
+    with ingest_lock():
+        # Açık Chroma client'ları silinen dosyalara yazmaya çalışmasın (readonly database hatası)
+        SharedSystemClient.clear_system_cache()
+        # Kilit dosyası silinmez; bekleyen süreçler aynı kilidi beklemeye devam eder
+        for child in PERSIST_DIRECTORY.iterdir():
+            if child == INGEST_LOCK_FILE:
+                continue
+            if child.is_dir():
+                shutil.rmtree(child)
+            else:
+                child.unlink()
+        get_sparse_index().load()
+        bump_index_version()
@@ -0,0 +1,188 @@
+"""
+LLM istemci modülü - Paylaşılan HTTP bağlantı havuzu
+
+Bu modül şu görevleri yerine getirir:
+- OpenAI çağrıları için süreç genelinde tek bir httpx bağlantı havuzu tutar
+- Async çağrılar için event loop başına paylaşılan bir AsyncClient tutar
+- Süreç başına eşzamanlı LLM isteklerini semafor ile sınırlar
+- Tüm oturumların aynı havuzu kullandığı ChatOpenAI nesneleri üretir
+- Ağ gerektirmeyen deterministik sahte LLM sağlar (LLM_PROVIDER=fake)
+"""
+from __future__ import annotations
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import threading
+import weakref
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import (
+    DEFAULT_OPENAI_MODEL, LLM_MAX_CONCURRENCY, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_TIMEOUT,
+    LLM_PROVIDER,
+)
+
+_CLIENT_LOCK = threading.Lock()
+_SYNC_CLIENT: Optional[httpx.Client] = None
+# asyncio nesneleri event loop'a bağlıdır; her loop kendi client/semaforunu alır
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
+    )
+
+def get_http_client() -> httpx.Client:
+    """
+    Süreç genelinde paylaşılan (thread-safe) sync HTTP client'ı döndürür.
+
+    """
+    global _SYNC_CLIENT
+    with _CLIENT_LOCK:
+        if _SYNC_CLIENT is None:
+            _SYNC_CLIENT = httpx.Client(limits=_limits(), timeout=LLM_HTTP_TIMEOUT)
+        return _SYNC_CLIENT
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Çalışan event loop için paylaşılan AsyncClient'ı döndürür (loop yoksa RuntimeError).
+
+    """
+    loop = asyncio.get_running_loop()
+    with _CLIENT_LOCK:
+        client = _ASYNC_CLIENTS.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=_limits(), timeout=LLM_HTTP_TIMEOUT)
+            _ASYNC_CLIENTS[loop] = client
+        return client
+
+class _LoopAsyncClient(httpx.AsyncClient):
+    """
+    ChatOpenAI'ye verilen AsyncClient. LLM nesneleri genelde loop dışında (thread,
+    Streamlit) oluşturulduğu için havuz kurulum anında değil, her istekte çalışan
+    loop'a göre seçilir; istek o loop'un paylaşılan client'ı üzerinden gönderilir.
+
+    """
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await get_async_http_client().send(request, **kwargs)
+
+    @property
+    def is_closed(self) -> bool:
+        return False
+
+    async def aclose(self) -> None:
+        pass  # Havuzlar loop'a aittir; LLM nesnesi kapatılınca kapanmaz
+
+_LOOP_ASYNC_CLIENT: Optional[_LoopAsyncClient] = None
+
+def get_loop_async_client() -> httpx.AsyncClient:
+    """
+    İstekleri çalışan event loop'un paylaşılan AsyncClient'ına yönlendiren client'ı döndürür.
+
+    """
+    global _LOOP_ASYNC_CLIENT
+    with _CLIENT_LOCK:
+        if _LOOP_ASYNC_CLIENT is None:
+            _LOOP_ASYNC_CLIENT = _LoopAsyncClient(timeout=LLM_HTTP_TIMEOUT)
+        return _LOOP_ASYNC_CLIENT
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """
+    Çalışan event loop için eşzamanlı LLM isteği semaforunu döndürür.
+
+    """
+    loop = asyncio.get_running_loop()
+    with _CLIENT_LOCK:
+        sem = _SEMAPHORES.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            _SEMAPHORES[loop] = sem
+        return sem
+
+@asynccontextmanager
+async def llm_slot() -> AsyncIterator[None]:
+    """
+    LLM_MAX_CONCURRENCY dolana kadar bekler; blok süresince bir slot tutar.
+
+    """
+    async with get_llm_semaphore():
+        yield
+
+class FakeChatModel(BaseChatModel):
+    """
+    Ağ gerektirmeyen deterministik sohbet modeli (test, benchmark, offline servis).
+    Prompt'taki CONTEXT'in ilk kelimelerini cevap olarak döndürür; araç çağırmaz.
+
+    """
+    model_name: str = "fake"
+    max_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-echo"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        last = messages[-1].content if messages else ""
+        last = last if isinstance(last, str) else str(last)
+        if "CONTEXT:" in last:
+            words = last.split("CONTEXT:", 1)[1].split()
+            if words:
+                return " ".join(words[: self.max_words])
+        return "Bu soruyu yüklenen dokümanlarda bulamadım."
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> dict:
+        prompt = sum(len(str(m.content).split()) for m in messages)
+        completion = len(text.split())
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._reply(messages)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._reply(messages)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            token = word if i == len(words) - 1 else word + " "
+            usage = self._usage(messages, text) if i == len(words) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        return self  # Araç çağırmaz; agent doğrudan cevap verir
+
+def create_llm(
+    model_name: str = DEFAULT_OPENAI_MODEL,
+    temperature: float = 0.1,
+    max_tokens: int = 1000,
+    **kwargs: Any,
+):
+    """
+    Paylaşılan bağlantı havuzunu kullanan ChatOpenAI oluşturur.
+    Async çağrılar, nerede oluşturulduğundan bağımsız olarak çağrının yapıldığı loop'un havuzunu kullanır.
+    LLM_PROVIDER=fake ise ağ gerektirmeyen FakeChatModel döndürür.
+
+    """
+    if LLM_PROVIDER == "fake":
+        return FakeChatModel()
+
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model_name,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream_usage=True,  # Streaming'de de token/maliyet takibi için
+        http_client=get_http_client(),
+        http_async_client=get_loop_async_client(),
+        **kwargs,
+    )
@@ -3,23 +3,47 @@ RAG Chain modülü - Basit Retrieval-Augmented Generation
 
 Bu modül şu görevleri yerine getirir:
 - Hybrid Retriever ile doküman alma (BM25 + Vector + RRF + Reranker)
+- Bellekteki vektör matrisi üzerinde NumPy ile MMR (MMRRetriever)
 - LLM'e bağlam ile soru gönderme
 - Dinamik prompt yönetimi (kısa/uzun cevap)
 - Token kullanımı takibi
+- Token bütçeli bağlam paketleme (örtüşen/bitişik chunk'ları birleştirme)
+- Semantik cevap önbelleği ve indeks sürümü takibi
+- Eşzamanlı kullanıcılar için async API (aanswer_with_chain)
+- Aşama bazlı süre ölçümü (tracing.span: cache, retrieve, pack_context, llm)
 """
 from __future__ import annotations
-from typing import List, Dict
+from typing import Any, List, Dict, Iterator, Optional, Tuple
+from collections import OrderedDict
 from dataclasses import dataclass
+import asyncio
+import threading
+import time
+import uuid
 
 from langchain_community.vectorstores import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
-from config import SEARCH_TYPE, TOP_K, MMR_LAMBDA, DEFAULT_OPENAI_MODEL
+from config import (
+    SEARCH_TYPE, TOP_K, MMR_LAMBDA, MMR_FETCH_K, DEFAULT_OPENAI_MODEL, HYBRID_FETCH_K, HYBRID_RRF_K,
+    RERANK_ENABLED, RERANK_CANDIDATES, RERANK_TOP_N, RERANK_MODEL_NAME, PERSIST_DIRECTORY, ANSWER_CACHE_ENABLED,
+    RETRIEVAL_CACHE_SIZE, CONTEXT_TOKEN_BUDGET, MMR_VECTOR_CACHE,
+)
 from pathlib import Path
-# Hybrid retriever removed for simplicity
+from answer_cache import get_answer_cache, normalize_question
+from embeddings import get_embeddings
+from tracing import span, record_stage
+
+INDEX_VERSION_FILE = PERSIST_DIRECTORY / "index_version"
+
+# (indeks sürümü, normalize soru, retriever parametreleri) -> chunk id'leri
+_RETRIEVAL_CACHE: "OrderedDict[Tuple, List[str]]" = OrderedDict()
+_RETRIEVAL_CACHE_LOCK = threading.Lock()
 
 def ensure_dirs(*paths: Path) -> None:
     """
@@ -29,6 +53,103 @@ def ensure_dirs(*paths: Path) -> None:
     for p in paths:
         p.mkdir(parents=True, exist_ok=True)
 
+def get_index_version() -> str:
+    """
+    Koleksiyonun güncel sürüm belirtecini döndürür (önbellek anahtarları için).
+    
+    """
+    try:
+        return INDEX_VERSION_FILE.read_text(encoding="utf-8").strip() or "empty"
+    except FileNotFoundError:
+        return "empty"
+
+def bump_index_version() -> str:
+    """
+    Koleksiyon değiştiğinde yeni bir sürüm belirteci yazar; önbellekler geçersizleşir.
+    
+    """
+    version = uuid.uuid4().hex
+    ensure_dirs(INDEX_VERSION_FILE.parent)
+    INDEX_VERSION_FILE.write_text(version, encoding="utf-8")
+    return version
+
+def llm_model_name(llm) -> str:
+    """
+    LLM nesnesinden model adını çıkarır (önbellek anahtarı için).
+    
+    """
+    return str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__)
+
+def empty_tokens() -> Dict:
+    """
+    Hiç LLM çağrısı yapılmadığında kullanılan token sözlüğü.
+    
+    """
+    return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "total_cost": 0.0}
+
+def tokens_from_callback(cb) -> Dict:
+    """
+    OpenAI callback handler'ından token/maliyet sözlüğü oluşturur.
+    
+    """
+    return {
+        "prompt_tokens": cb.prompt_tokens,
+        "completion_tokens": cb.completion_tokens,
+        "total_tokens": cb.total_tokens,
+        "total_cost": cb.total_cost
+    }
+
+def cache_lookup(question: str, *, mode: str, is_short: bool, model: str) -> Tuple[Optional[Dict], Optional[List[float]]]:
+    """
+    Cevap önbelleğine bakar. (önbellekteki sonuç veya None, soru embedding'i) döndürür.
+    
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    cache = get_answer_cache()
+    captured: Dict[str, List[float]] = {}
+
+    def _embed(text: str) -> List[float]:
+        captured["vec"] = get_embeddings().embed_query(text)
+        return captured["vec"]
+
+    hit = cache.lookup(
+        question, mode=mode, is_short=is_short, model=model,
+        index_version=get_index_version(), embed_fn=_embed,
+    )
+    if hit is None:
+        return None, captured.get("vec")
+    docs = [Document(page_content="", metadata=m) for m in hit["sources"]]
+    return {
+        "answer": hit["answer"],
+        "docs": docs,
+        "citations": hit["citations"],
+        "tokens": empty_tokens(),
+        "cache": cache.report(hit=True),
+    }, None
+
+def cache_store(
+    question: str, result: Dict, *, mode: str, is_short: bool, model: str,
+    embedding: Optional[List[float]] = None,
+) -> None:
+    """
+    Yeni üretilen cevabı önbelleğe yazar ve sonuca önbellek bilgisini ekler.
+    
+    """
+    if not ANSWER_CACHE_ENABLED:
+        result["cache"] = None
+        return
+    cache = get_answer_cache()
+    if embedding is None:
+        embedding = get_embeddings().embed_query(question)
+    cache.store(
+        question, mode=mode, is_short=is_short, model=model, index_version=get_index_version(),
+        answer=result["answer"], citations=result["citations"],
+        sources=[d.metadata for d in result["docs"]],
+        total_tokens=result["tokens"]["total_tokens"], embedding=embedding,
+    )
+    result["cache"] = cache.report(hit=False)
+
 def format_citations(docs: List[Document]) -> str:
     """
     Dokümanlardan kaynak gösterimleri oluşturur (alıntı formatı).
@@ -36,34 +157,145 @@ def format_citations(docs: List[Document]) -> str:
     """
     if not docs:
         return ""
+    from dedup import parse_refs
+
     items = []
     seen = set()
     for d in docs:
+        # Tekilleştirilmiş chunk'lar içeriğin geçtiği tüm kaynakları taşır
+        for source, page in parse_refs(d.metadata or {}):
+            src = Path(source).name
+            key = (src, page)
+            if key in seen:
+                continue
+            seen.add(key)
+            if page is not None:
+                items.append(f"[kaynak: {src} p.{page + 1}]")
+            else:
+                items.append(f"[kaynak: {src}]")
+    return " ".join(items)
+
+def _doc_header(i: int, meta: Dict[str, Any]) -> str:
+    src = meta.get("source", "")
+    page = meta.get("page", None)
+    extra = meta.get("ref_count", 1) - 1
+    return (
+        f"--- DOC {i} | {src}" + (f" | page {page + 1}" if page is not None else "")
+        + (f" | +{extra} kaynak" if extra > 0 else "") + " ---"
+    )
+
+def _join_spans(a_start: int, a_text: str, b_start: int, b_text: str) -> Optional[str]:
+    """
+    Aynı sayfadaki iki parçayı (a, b'den önce başlar) örtüşme metnini tekrarlamadan
+    birleştirir. Parçalar örtüşmüyor/bitişik değilse veya metinler uyuşmuyorsa None.
+
+    """
+    a_end = a_start + len(a_text)
+    gap = b_start - a_end
+    if gap > 2:  # Arada gönderilmemiş metin var: ayrı blok
+        return None
+    if gap > 0:  # Sadece bölücünün kırptığı boşluk
+        return a_text + "\n" + b_text
+    offset = b_start - a_start
+    if b_start + len(b_text) <= a_end:  # b tamamen a'nın içinde
+        return a_text if a_text[offset:offset + len(b_text)] == b_text else None
+    overlap = a_end - b_start
+    if a_text[offset:] != b_text[:overlap]:
+        return None  # Yakın-tekrar birleştirmesi vb.: konumlar bu metne ait değil
+    return a_text + b_text[overlap:]
+
+def _truncate_to_tokens(text: str, budget: int, model_name: str) -> str:
+    from history import text_tokens
+
+    total = text_tokens(text, model_name)
+    if total <= budget:
+        return text
+    return text[:max(0, int(len(text) * budget / total))].rstrip() + " …"
+
+def pack_context(
+    docs: List[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    model_name: str = DEFAULT_OPENAI_MODEL,
+) -> Tuple[str, List[Document], Dict[str, int]]:
+    """
+    Dokümanları token bütçesi içinde LLM bağlamına paketler.
+
+    - Aynı kaynak/sayfadaki örtüşen veya bitişik chunk'lar tek blokta birleşir,
+      örtüşme metni (CHUNK_OVERLAP) bir kez gönderilir
+    - Bütçe alaka sırasıyla doldurulur; sığmayan chunk atlanır (ilk chunk kırpılır)
+
+    (context, bağlama giren dokümanlar, {"context_tokens", "context_tokens_saved"}) döndürür.
+
+    """
+    from history import text_tokens
+
+    regions: List[Dict[str, Any]] = []  # {"rank", "meta", "start", "text", "docs", "cost"}
+    used = 0
+
+    def cost(meta: Dict[str, Any], text: str) -> int:
+        return text_tokens(_doc_header(0, meta), model_name) + text_tokens(text, model_name) + 2
+
+    for rank, d in enumerate(docs):
         meta = d.metadata or {}
-        src = Path(meta.get("source", "unknown")).name
-        page = meta.get("page", None)
-        key = (src, page)
-        if key in seen:
+        text = d.page_content.strip()
+        if not text:
             continue
-        seen.add(key)
-        if page is not None:
-            items.append(f"[kaynak: {src} p.{page + 1}]")
-        else:
-            items.append(f"[kaynak: {src}]")
-    return " ".join(items)
+        key = (meta.get("source", ""), meta.get("page"))
+        region = {"rank": rank, "meta": meta, "start": meta.get("start_index"), "text": text, "docs": [d]}
+        absorbed: List[Dict[str, Any]] = []
+        if region["start"] is not None:
+            # Yeni parça birden fazla bloğu birbirine bağlayabilir: değişiklik kalmayana kadar birleştir
+            changed = True
+            while changed:
+                changed = False
+                for r in regions:
+                    if r in absorbed or r["start"] is None or (r["meta"].get("source", ""), r["meta"].get("page")) != key:
+                        continue
+                    first, second = (r, region) if r["start"] <= region["start"] else (region, r)
+                    joined = _join_spans(first["start"], first["text"], second["start"], second["text"])
+                    if joined is None:
+                        continue
+                    best = r if r["rank"] < region["rank"] else region
+                    region = {
+                        "rank": best["rank"], "meta": best["meta"], "start": first["start"], "text": joined,
+                        "docs": r["docs"] + region["docs"],
+                    }
+                    absorbed.append(r)
+                    changed = True
+        region["cost"] = cost(region["meta"], region["text"])
+        delta = region["cost"] - sum(r["cost"] for r in absorbed)
+        if token_budget > 0 and used + delta > token_budget:
+            if regions:
+                continue  # Sonraki (daha kısa / birleşen) chunk'lar sığabilir
+            # Tek chunk bile sığmıyorsa kırpılmış halini gönder
+            header = text_tokens(_doc_header(0, meta), model_name) + 2
+            region["text"] = _truncate_to_tokens(region["text"], token_budget - header, model_name)
+            region["cost"] = cost(region["meta"], region["text"])
+            delta = region["cost"]
+        regions = [r for r in regions if r not in absorbed] + [region]
+        used += delta
+
+    regions.sort(key=lambda r: r["rank"])
+    context = "\n\n".join(
+        _doc_header(i, r["meta"]) + "\n" + r["text"] for i, r in enumerate(regions, 1)
+    )
+    order = {id(d): i for i, d in enumerate(docs)}
+    used_docs = sorted((d for r in regions for d in r["docs"]), key=lambda d: order[id(d)])
+    context_tokens = text_tokens(context, model_name) if context else 0
+    # Paketlenmemiş (tüm chunk'lar tam metin) bağlamla karşılaştırma
+    raw = "\n\n".join(_doc_header(i, d.metadata or {}) + "\n" + d.page_content.strip() for i, d in enumerate(docs, 1))
+    raw_tokens = text_tokens(raw, model_name) if raw else 0
+    return context, used_docs, {
+        "context_tokens": context_tokens,
+        "context_tokens_saved": max(0, raw_tokens - context_tokens),
+    }
 
-def format_docs_for_prompt(docs: List[Document]) -> str:
+def format_docs_for_prompt(docs: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
     """
     Dokümanları LLM prompt'u için formatlar (bağlam oluşturma).
     
     """
-    blocks = []
-    for i, d in enumerate(docs, 1):
-        src = d.metadata.get("source", "")
-        page = d.metadata.get("page", None)
-        header = f"--- DOC {i} | {src}" + (f" | page {page + 1}" if page is not None else "") + " ---"
-        blocks.append(header + "\n" + d.page_content.strip())
-    return "\n\n".join(blocks)
+    return pack_context(docs, token_budget)[0]
 
 SYSTEM_PROMPT_SHORT = """
 Sen bir kurumsal bilgi tabanı asistanısın. Verilen CONTEXT içindeki bilgilere dayanarak KISA ve ÖZ cevaplar ver.
@@ -107,47 +339,442 @@ def get_prompt_template(is_short=True):
         ]
     )
 
-def build_retriever(vs: Chroma, search_type: str = SEARCH_TYPE, top_k: int = TOP_K, mmr_lambda: float = MMR_LAMBDA):
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 (sparse) ve vektör (dense) sonuçlarını Reciprocal Rank Fusion ile birleştirir.
+    
+    """
+    vectorstore: Any
+    sparse_index: Any
+    k: int = TOP_K
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = HYBRID_RRF_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with span("retrieve.dense"):
+            dense_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        with span("retrieve.bm25"):
+            sparse_hits = self.sparse_index.search(query, self.fetch_k)
+
+        # RRF: her listede rank r için 1 / (rrf_k + r)
+        scores: Dict[str, float] = {}
+        docs_by_id: Dict[str, Document] = {}
+        for rank, d in enumerate(dense_docs, 1):
+            if d.id is None:
+                continue
+            docs_by_id[d.id] = d
+            scores[d.id] = scores.get(d.id, 0.0) + 1.0 / (self.rrf_k + rank)
+        for rank, (doc_id, _) in enumerate(sparse_hits, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+
+        top_ids = sorted(scores, key=scores.get, reverse=True)[: self.k]
+        # Sadece BM25'ten gelen chunk'ların içeriğini Chroma'dan tek seferde çek
+        missing = [i for i in top_ids if i not in docs_by_id]
+        if missing:
+            got = self.vectorstore.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+                docs_by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=meta or {})
+        return [docs_by_id[i] for i in top_ids if i in docs_by_id]
+
+# {"key": (koleksiyon, indeks sürümü), "matrix": float32 L2-normalize vektörler, "rows": id -> satır}.
+# Yeniden yüklemede sözlük değiştirilmez, yenisiyle değiştirilir (okuyan sorgular tutarlı kopyayı görür)
+_VECTOR_MATRIX: Dict[str, Dict[str, Any]] = {}
+_VECTOR_MATRIX_LOCK = threading.Lock()
+
+def _normalize_rows(matrix):
+    import numpy as np
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def get_vector_matrix(vs: Chroma) -> Dict[str, Any]:
+    """
+    Koleksiyondaki tüm chunk vektörlerini bellekte tek bir float32 matriste tutar.
+    İndeks sürümü değişince (yeniden indeksleme / silme) matris yeniden yüklenir.
+
+    """
+    import numpy as np
+
+    collection = vs._collection
+    key = (str(collection.id), get_index_version())
+    with _VECTOR_MATRIX_LOCK:
+        current = _VECTOR_MATRIX.get("current")
+        if current is not None and current["key"] == key:
+            return current
+        with span("retrieve.mmr_load") as sp:
+            ids: List[str] = []
+            blocks = []
+            offset, page = 0, 5000
+            while True:
+                got = collection.get(include=["embeddings"], limit=page, offset=offset)
+                if not got["ids"]:
+                    break
+                ids.extend(got["ids"])
+                blocks.append(np.asarray(got["embeddings"], dtype=np.float32))
+                offset += len(got["ids"])
+            matrix = _normalize_rows(np.vstack(blocks)) if blocks else np.zeros((0, 0), dtype=np.float32)
+            sp.set(vectors=len(ids))
+        current = _VECTOR_MATRIX["current"] = {
+            "key": key, "matrix": matrix, "rows": {i: n for n, i in enumerate(ids)},
+        }
+        return current
+
+def mmr_select(query_vec, candidates, k: int, lambda_mult: float) -> List[int]:
+    """
+    Greedy MMR: her adımda lambda * sim(soru) - (1 - lambda) * max sim(seçilenler)
+    skorunu en yüksek adayı seçer. Seçilenlere olan en yüksek benzerlik her adımda
+    sadece yeni seçilen vektörle güncellenir (O(k * fetch_k * boyut)).
+    Vektörler L2-normalize olmalıdır. Seçim sırasıyla aday indekslerini döndürür.
+
+    """
+    import numpy as np
+
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    relevance = candidates @ query_vec
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    selected = [int(np.argmax(relevance))]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    for _ in range(min(k, n) - 1):
+        np.maximum(max_sim, candidates @ candidates[selected[-1]], out=max_sim)
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+    return selected
+
+class MMRRetriever(BaseRetriever):
+    """
+    Maximal Marginal Relevance: Chroma'dan sadece aday id/metinlerini alır, vektörleri
+    bellekteki matristen okur ve seçimi NumPy ile yapar. Büyük fetch_k değerlerinde
+    aday vektörleri sorgu başına Chroma'dan taşınmadığı için gecikme düşük kalır.
+
+    """
+    vectorstore: Any
+    k: int = TOP_K
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        import numpy as np
+
+        collection = self.vectorstore._collection
+        query_vec = np.asarray(self.vectorstore.embeddings.embed_query(query), dtype=np.float32)
+        with span("retrieve.dense"):
+            # Sadece id'ler: metin/metadata seçilen k chunk için sonradan alınır
+            ids = collection.query(query_embeddings=[query_vec.tolist()], n_results=self.fetch_k, include=[])["ids"][0]
+        if not ids:
+            return []
+        with span("retrieve.mmr", candidates=len(ids)):
+            store = get_vector_matrix(self.vectorstore) if MMR_VECTOR_CACHE else None
+            rows = [store["rows"].get(i) for i in ids] if store else [None] * len(ids)
+            missing = [i for i, r in zip(ids, rows) if r is None]
+            if missing:
+                # Matris yüklendikten sonra yazılmış chunk'lar (veya önbellek kapalı): vektörleri Chroma'dan al
+                fetched = collection.get(ids=missing, include=["embeddings"])
+                extra = dict(zip(fetched["ids"], _normalize_rows(np.asarray(fetched["embeddings"], dtype=np.float32))))
+                ids = [i for i, r in zip(ids, rows) if r is not None or i in extra]
+                candidates = np.stack([store["matrix"][store["rows"][i]] if i not in extra else extra[i] for i in ids])
+            else:
+                candidates = store["matrix"][rows]
+            norm = float(np.linalg.norm(query_vec)) or 1.0
+            selected = [ids[n] for n in mmr_select(query_vec / norm, candidates, self.k, self.lambda_mult)]
+        got = collection.get(ids=selected, include=["documents", "metadatas"])
+        by_id = {
+            i: Document(id=i, page_content=text or "", metadata=meta or {})
+            for i, text, meta in zip(got["ids"], got["documents"], got["metadatas"])
+        }
+        return [by_id[i] for i in selected if i in by_id]
+
+class CachedRetriever(BaseRetriever):
+    """
+    Alt retriever'ın sonuçlarını (chunk id listesi) LRU önbellekte tutar.
+    Anahtar indeks sürümünü içerdiği için yeniden indeksleme önbelleği geçersizleştirir.
+    
+    """
+    base_retriever: BaseRetriever
+    vectorstore: Any
+    params: Tuple = ()
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = (get_index_version(), normalize_question(query), self.params)
+        with _RETRIEVAL_CACHE_LOCK:
+            ids = _RETRIEVAL_CACHE.get(key)
+            if ids is not None:
+                _RETRIEVAL_CACHE.move_to_end(key)
+
+        if ids is not None:
+            if not ids:
+                return []
+            got = self.vectorstore.get(ids=ids, include=["documents", "metadatas"])
+            by_id = {
+                i: Document(id=i, page_content=text, metadata=meta or {})
+                for i, text, meta in zip(got["ids"], got["documents"], got["metadatas"])
+            }
+            if len(by_id) == len(ids):
+                return [by_id[i] for i in ids]
+
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        if all(d.id for d in docs):
+            with _RETRIEVAL_CACHE_LOCK:
+                _RETRIEVAL_CACHE[key] = [d.id for d in docs]
+                while len(_RETRIEVAL_CACHE) > RETRIEVAL_CACHE_SIZE:
+                    _RETRIEVAL_CACHE.popitem(last=False)
+        return docs
+
+def _resolve_fetch_k(search_type: str, top_k: int, fetch_k: Optional[int]) -> Optional[int]:
+    if search_type == "hybrid":
+        return max(fetch_k or HYBRID_FETCH_K, top_k)
+    if search_type == "mmr":
+        return max(fetch_k or max(MMR_FETCH_K, top_k * 5), top_k)
+    return None
+
+def retrieval_signature(retriever) -> str:
+    """
+    build_retriever ile kurulmuş retriever'ın ayar özeti (cevap önbelleği anahtarı için).
+    Farklı retrieval ayarlarıyla üretilmiş cevaplar birbirinin yerine kullanılmaz.
+
+    """
+    return (getattr(retriever, "metadata", None) or {}).get("retrieval_config", type(retriever).__name__)
+
+def build_retriever(
+    vs: Chroma,
+    search_type: str = SEARCH_TYPE,
+    top_k: int = TOP_K,
+    mmr_lambda: float = MMR_LAMBDA,
+    rerank: bool = RERANK_ENABLED,
+    cache: bool = RETRIEVAL_CACHE_SIZE > 0,
+    fetch_k: Optional[int] = None,
+):
     """
-    Basit retriever oluşturur - Vector search.
+    Retriever oluşturur - Vector search (similarity / MMR) veya Hybrid (BM25 + Vector + RRF).
+    rerank=True ise RERANK_CANDIDATES aday alınır ve cross-encoder ile
+    min(top_k, RERANK_TOP_N) chunk'a indirilir. cache=True ise sonuçlar
+    (soru, k, search_type, lambda) anahtarıyla önbelleğe alınır.
+    fetch_k: MMR / hybrid için aday sayısı (None = max(MMR_FETCH_K, 5 * top_k) / HYBRID_FETCH_K).
+    Ayarların özeti retriever.metadata["retrieval_config"] altında tutulur (retrieval_signature).
     
     """
+    retriever = _build_retriever(vs, search_type, top_k, mmr_lambda, rerank, cache, fetch_k)
+    parts = [search_type, f"k={top_k}"]
+    resolved = _resolve_fetch_k(search_type, top_k, fetch_k)
+    if resolved is not None:
+        parts.append(f"fetch_k={resolved}")
+    if search_type == "mmr":
+        parts.append(f"lambda={mmr_lambda}")
+    elif search_type == "hybrid":
+        parts.append(f"rrf_k={HYBRID_RRF_K}")
+    if rerank:
+        parts.append(f"rerank={RERANK_MODEL_NAME}:{RERANK_CANDIDATES}:{min(top_k, RERANK_TOP_N)}")
+    parts.append(f"context={CONTEXT_TOKEN_BUDGET}")
+    retriever.metadata = {**(retriever.metadata or {}), "retrieval_config": "|".join(parts)}
+    return retriever
+
+def _build_retriever(
+    vs: Chroma,
+    search_type: str,
+    top_k: int,
+    mmr_lambda: float,
+    rerank: bool,
+    cache: bool,
+    fetch_k: Optional[int],
+):
+    if cache:
+        base = build_retriever(vs, search_type, top_k, mmr_lambda, rerank=rerank, cache=False, fetch_k=fetch_k)
+        return CachedRetriever(
+            base_retriever=base,
+            vectorstore=vs,
+            params=(top_k, search_type, mmr_lambda, rerank, fetch_k),
+        )
+    if rerank:
+        from rerank import RerankRetriever
+        base = build_retriever(
+            vs, search_type, max(top_k, RERANK_CANDIDATES), mmr_lambda, rerank=False, cache=False, fetch_k=fetch_k,
+        )
+        return RerankRetriever(base_retriever=base, top_n=min(top_k, RERANK_TOP_N))
+    if search_type == "hybrid":
+        from sparse_index import get_sparse_index
+        return HybridRetriever(
+            vectorstore=vs,
+            sparse_index=get_sparse_index(),
+            k=top_k,
+            fetch_k=_resolve_fetch_k(search_type, top_k, fetch_k),
+        )
     if search_type == "mmr":
-        return vs.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": top_k, "fetch_k": max(50, top_k * 5), "lambda_mult": mmr_lambda},
+        return MMRRetriever(
+            vectorstore=vs,
+            k=top_k,
+            fetch_k=_resolve_fetch_k(search_type, top_k, fetch_k),
+            lambda_mult=mmr_lambda,
         )
     return vs.as_retriever(search_kwargs={"k": top_k})
 
 def answer_with_chain(llm, retriever, question: str, is_short: bool = True) -> Dict:
     """
     RAG Chain ile soru cevaplar (Retrieve + Generate).
+    Aynı/benzer soru önbellekte varsa retrieval ve LLM çağrısı yapılmaz.
     
     """
     from langchain_community.callbacks import get_openai_callback
     
-    # Retrieve
-    docs: List[Document] = retriever.invoke(question)
-    context = format_docs_for_prompt(docs)
-    
-    # Generate with appropriate prompt - token tracking ile
-    prompt_template = get_prompt_template(is_short)
-    chain = prompt_template | llm | StrOutputParser()
-    
-    # Token kullanımını takip et
-    with get_openai_callback() as cb:
-        answer = chain.invoke({"question": question, "context": context})
-        tokens_used = {
-            "prompt_tokens": cb.prompt_tokens,
-            "completion_tokens": cb.completion_tokens,
-            "total_tokens": cb.total_tokens,
-            "total_cost": cb.total_cost
+    model = llm_model_name(llm)
+    cache_mode = f"rag_chain:{retrieval_signature(retriever)}"
+    with span("chain", mode="sync") as root:
+        with span("chain.cache_lookup"):
+            cached, query_vec = cache_lookup(question, mode=cache_mode, is_short=is_short, model=model)
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        # Retrieve
+        with span("chain.retrieve") as sp:
+            docs: List[Document] = retriever.invoke(question)
+            sp.set(chunks=len(docs))
+        # Bütçeye sığanlar: kaynaklar sadece prompt'a giren chunk'lardan
+        with span("chain.pack_context") as sp:
+            context, docs, context_info = pack_context(docs, model_name=model)
+            sp.set(chunks=len(docs), **context_info)
+        
+        # Generate with appropriate prompt - token tracking ile
+        prompt_template = get_prompt_template(is_short)
+        chain = prompt_template | llm | StrOutputParser()
+        
+        # Token kullanımını takip et
+        with span("chain.llm") as sp, get_openai_callback() as cb:
+            answer = chain.invoke({"question": question, "context": context})
+            tokens_used = {
+                "prompt_tokens": cb.prompt_tokens,
+                "completion_tokens": cb.completion_tokens,
+                "total_tokens": cb.total_tokens,
+                "total_cost": cb.total_cost
+            }
+            sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+        tokens_used.update(context_info)
+        
+        cites = format_citations(docs)
+        result = {
+            "answer": answer, 
+            "docs": docs, 
+            "citations": cites,
+            "tokens": tokens_used
         }
+        with span("chain.cache_store"):
+            cache_store(question, result, mode=cache_mode, is_short=is_short, model=model, embedding=query_vec)
+        return result
+
+def stream_answer_with_chain(llm, retriever, question: str, is_short: bool = True) -> Iterator[Dict]:
+    """
+    answer_with_chain'in streaming versiyonu. Sırasıyla şu olayları üretir:
+    {"type": "sources", "docs", "citations"} - retrieval biter bitmez
+    {"type": "token", "content"} - LLM'den gelen her parça için
+    {"type": "done", "result"} - answer_with_chain ile aynı sonuç sözlüğü
     
-    cites = format_citations(docs)
-    return {
-        "answer": answer, 
-        "docs": docs, 
-        "citations": cites,
-        "tokens": tokens_used
-    }
+    """
+    from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+
+    model = llm_model_name(llm)
+    cache_mode = f"rag_chain:{retrieval_signature(retriever)}"
+    with span("chain", mode="stream") as root:
+        with span("chain.cache_lookup"):
+            cached, query_vec = cache_lookup(question, mode=cache_mode, is_short=is_short, model=model)
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            yield {"type": "sources", "docs": cached["docs"], "citations": cached["citations"]}
+            yield {"type": "token", "content": cached["answer"]}
+            yield {"type": "done", "result": cached}
+            return
+
+        # Retrieve - kaynaklar cevaptan önce gösterilebilsin
+        with span("chain.retrieve") as sp:
+            docs: List[Document] = retriever.invoke(question)
+            sp.set(chunks=len(docs))
+        with span("chain.pack_context") as sp:
+            context, docs, context_info = pack_context(docs, model_name=model)
+            sp.set(chunks=len(docs), **context_info)
+        cites = format_citations(docs)
+        yield {"type": "sources", "docs": docs, "citations": cites}
+
+        prompt_template = get_prompt_template(is_short)
+        chain = prompt_template | llm | StrOutputParser()
+
+        # Generator'da context manager yerine handler'ı doğrudan config ile geçir
+        cb = OpenAICallbackHandler()
+        parts: List[str] = []
+        with span("chain.llm") as sp:
+            for token in chain.stream({"question": question, "context": context}, config={"callbacks": [cb]}):
+                if not parts:
+                    record_stage("chain.first_token", root.elapsed())  # Soru -> ilk token gecikmesi
+                parts.append(token)
+                yield {"type": "token", "content": token}
+            sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+
+        result = {
+            "answer": "".join(parts),
+            "docs": docs,
+            "citations": cites,
+            "tokens": {**tokens_from_callback(cb), **context_info},
+        }
+        with span("chain.cache_store"):
+            cache_store(question, result, mode=cache_mode, is_short=is_short, model=model, embedding=query_vec)
+        yield {"type": "done", "result": result}
+
+async def aanswer_with_chain(llm, retriever, question: str, is_short: bool = True) -> Dict:
+    """
+    answer_with_chain'in async versiyonu. Retrieval ve LLM çağrısı event loop'u
+    bloklamaz; LLM istekleri süreç başına LLM_MAX_CONCURRENCY ile sınırlanır.
+    
+    """
+    from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+    from llm_clients import llm_slot
+
+    model = llm_model_name(llm)
+    cache_mode = f"rag_chain:{retrieval_signature(retriever)}"
+    with span("chain", mode="async") as root:
+        # SQLite + embedding çağrıları bloklayıcı: thread'e al
+        with span("chain.cache_lookup"):
+            cached, query_vec = await asyncio.to_thread(
+                cache_lookup, question, mode=cache_mode, is_short=is_short, model=model
+            )
+        root.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        with span("chain.retrieve") as sp:
+            docs: List[Document] = await retriever.ainvoke(question)
+            sp.set(chunks=len(docs))
+        with span("chain.pack_context") as sp:
+            context, docs, context_info = pack_context(docs, model_name=model)
+            sp.set(chunks=len(docs), **context_info)
+
+        prompt_template = get_prompt_template(is_short)
+        chain = prompt_template | llm | StrOutputParser()
+
+        cb = OpenAICallbackHandler()
+        t_wait = time.perf_counter()
+        async with llm_slot():
+            record_stage("chain.llm_wait", time.perf_counter() - t_wait)  # LLM_MAX_CONCURRENCY kuyruğu
+            with span("chain.llm") as sp:
+                answer = await chain.ainvoke({"question": question, "context": context}, config={"callbacks": [cb]})
+                sp.set(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
+
+        result = {
+            "answer": answer,
+            "docs": docs,
+            "citations": format_citations(docs),
+            "tokens": {**tokens_from_callback(cb), **context_info},
+        }
+        with span("chain.cache_store"):
+            await asyncio.to_thread(
+                cache_store, question, result, mode=cache_mode, is_short=is_short, model=model, embedding=query_vec
+            )
+        return result
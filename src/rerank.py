@@ -0,0 +1,118 @@
+"""
+Rerank modülü - Cross-encoder ile yeniden sıralama
+
+Bu modül şu görevleri yerine getirir:
+- Küçük, yerel bir cross-encoder modelini süreç başına bir kez yükler (CPU)
+- Retriever'dan gelen geniş aday kümesini tek batch'lik forward pass ile skorlar
+- Sadece en ilgili top-n chunk'ı LLM'e gönderir (daha az prompt token'ı)
+- Gecikme bütçesine sığacak kadar adayı skorlar
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import threading
+import time
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import RERANK_MODEL_NAME, RERANK_TOP_N, RERANK_BUDGET_MS, RERANK_MAX_LENGTH
+from tracing import span
+
+_MODEL_LOCK = threading.Lock()
+_MODEL: Optional[Any] = None
+_STATS: Dict[str, Any] = {
+    "model_name": None,
+    "load_seconds": None,
+    "calls": 0,
+    "pair_seconds": None,  # Aday başına ortalama skorlama süresi (EWMA)
+    "last_ms": None,
+}
+
+def get_cross_encoder() -> Any:
+    """
+    Paylaşılan cross-encoder modelini döndürür (ilk çağrıda yükler ve ısındırır).
+
+    """
+    global _MODEL
+    if _MODEL is None:
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                from sentence_transformers import CrossEncoder
+
+                t0 = time.perf_counter()
+                model = CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=RERANK_MAX_LENGTH)
+                model.predict([("warmup", "warmup")])
+                _STATS.update(model_name=RERANK_MODEL_NAME, load_seconds=round(time.perf_counter() - t0, 3))
+                _MODEL = model
+    return _MODEL
+
+def _candidate_limit(top_n: int, budget_ms: float) -> Optional[int]:
+    """
+    Önceki çağrıların aday başına süresine göre bütçeye sığan aday sayısını hesaplar.
+
+    """
+    per_pair = _STATS["pair_seconds"]
+    if budget_ms <= 0 or not per_pair:
+        return None
+    return max(top_n, int(budget_ms / 1000.0 / per_pair))
+
+def rerank_documents(
+    query: str, docs: List[Document], top_n: int = RERANK_TOP_N, budget_ms: float = RERANK_BUDGET_MS
+) -> List[Document]:
+    """
+    Dokümanları cross-encoder skoruna göre sıralar ve en iyi top_n tanesini döndürür.
+    Bütçe aşılacaksa retriever sırasına göre en alttaki adaylar skorlanmadan elenir.
+
+    """
+    if len(docs) <= top_n:
+        return docs
+    try:
+        model = get_cross_encoder()
+    except Exception:
+        return docs[:top_n]  # Model yüklenemezse retriever sırasıyla devam et
+
+    limit = _candidate_limit(top_n, budget_ms)
+    candidates = docs[:limit] if limit else docs
+    pairs = [(query, d.page_content) for d in candidates]
+
+    t0 = time.perf_counter()
+    with span("retrieve.rerank", candidates=len(pairs)):
+        scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+    elapsed = time.perf_counter() - t0
+
+    per_pair = elapsed / len(pairs)
+    prev = _STATS["pair_seconds"]
+    _STATS.update(
+        calls=_STATS["calls"] + 1,
+        pair_seconds=per_pair if prev is None else 0.8 * prev + 0.2 * per_pair,
+        last_ms=round(elapsed * 1000, 1),
+    )
+
+    ranked = sorted(zip(candidates, scores), key=lambda x: float(x[1]), reverse=True)[:top_n]
+    out = []
+    for d, score in ranked:
+        out.append(Document(id=d.id, page_content=d.page_content, metadata={**d.metadata, "rerank_score": float(score)}))
+    return out
+
+class RerankRetriever(BaseRetriever):
+    """
+    Alt retriever'dan geniş aday kümesi alıp cross-encoder ile top-n'e indirir.
+
+    """
+    base_retriever: BaseRetriever
+    top_n: int = RERANK_TOP_N
+    budget_ms: float = RERANK_BUDGET_MS
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return rerank_documents(query, docs, top_n=self.top_n, budget_ms=self.budget_ms)
+
+def get_rerank_stats() -> Dict[str, Any]:
+    """
+    Rerank metriklerini döndürür.
+
+    """
+    return dict(_STATS)
@@ -0,0 +1,186 @@
+"""
+HTTP servis modülü - Streamlit'siz (headless) sorgu servisi
+
+Bu modül şu görevleri yerine getirir:
+- RAG çekirdeğini (get_vectorstore, build_retriever, answer_with_chain, run_agent)
+  diğer iç araçlar için bir ASGI servisi olarak sunar
+- /query, /ingest, /health ve /metrics endpoint'lerini sağlar
+- Embedding modeli, vector store, retriever, LLM ve agent'ları worker başına bir kez yükler
+- LLM_PROVIDER=fake ile ağ/API anahtarı olmadan test edilebilir
+- Çoklu worker'da indeks değişince Chroma'yı diskten yeniden açar; /ingest
+  çağrıları worker'lar arasında ingest.py'deki dosya kilidiyle sıraya girer
+
+Çalıştırma (src klasöründen):
+    uvicorn server:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Literal, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from config import UPLOAD_DIRECTORY, DEFAULT_OPENAI_MODEL, SEARCH_TYPE, TOP_K, MMR_LAMBDA
+from embeddings import get_embeddings, get_embedding_stats
+from ingest import ALLOWED_EXTS, get_vectorstore, index_files
+from llm_clients import create_llm
+from rag_chain import ensure_dirs, get_index_version, build_retriever, aanswer_with_chain, llm_model_name
+from agent import build_agent, arun_agent
+from tracing import prometheus_text, snapshot
+
+class ChatTurn(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    mode: Literal["rag_chain", "agent"] = "rag_chain"
+    is_short: bool = True
+    chat_history: List[ChatTurn] = Field(default_factory=list)
+
+class IngestRequest(BaseModel):
+    # UPLOAD_DIRECTORY'ye göre dosya adları; boşsa klasördeki tüm PDF/DOCX dosyaları
+    paths: Optional[List[str]] = None
+
+class _ServiceState:
+    """
+    Worker başına paylaşılan RAG nesneleri. İndeks sürümü değişince (bu ya da
+    başka bir worker /ingest yaptıysa) Chroma diskten yeniden açılır ve retriever
+    ile agent'lar yeniden kurulur; aksi halde bu worker eski HNSW indeksinden
+    cevap vermeye devam ederdi.
+
+    """
+
+    def __init__(self) -> None:
+        self.llm = None
+        self.model_name = DEFAULT_OPENAI_MODEL
+        self.vectorstore = None
+        self.retriever = None
+        self.agents: Dict[bool, Any] = {}
+        self.index_version: Optional[str] = None
+        self.ingest_lock = asyncio.Lock()
+        self._refresh_lock = threading.Lock()
+        self.started = time.time()
+
+    def build(self) -> None:
+        ensure_dirs(UPLOAD_DIRECTORY)
+        get_embeddings().load()
+        self.llm = create_llm(DEFAULT_OPENAI_MODEL, temperature=0.1, max_tokens=1000)
+        self.model_name = llm_model_name(self.llm)
+        self._build_retrievers(reload=False)
+
+    def _build_retrievers(self, reload: bool) -> None:
+        version = get_index_version()
+        vectorstore = get_vectorstore(reload=reload)
+        retriever = build_retriever(vectorstore, SEARCH_TYPE, TOP_K, MMR_LAMBDA)
+        agents = {is_short: build_agent(self.llm, retriever, is_short) for is_short in (True, False)}
+        # Süren sorgular eski nesnelerle tamamlanır; yeni sorgular tutarlı bir set görür
+        self.vectorstore, self.retriever, self.agents, self.index_version = vectorstore, retriever, agents, version
+
+    def refresh(self) -> None:
+        """
+        İndeks sürümü değiştiyse retriever ve agent'ları yeniden kurar. Disk/Chroma işi
+        yaptığı için event loop'ta değil asyncio.to_thread ile çağrılır; aynı anda gelen
+        sorgular yeniden kurulumu bir kez yapar.
+
+        """
+        if get_index_version() == self.index_version:
+            return
+        with self._refresh_lock:
+            if get_index_version() != self.index_version:
+                self._build_retrievers(reload=True)
+
+_STATE = _ServiceState()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ağır nesneler (model, Chroma) worker açılırken bir kez yüklenir
+    await asyncio.to_thread(_STATE.build)
+    yield
+
+app = FastAPI(title="DocuBrain API", lifespan=lifespan)
+
+def _to_messages(history: List[ChatTurn]) -> List:
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return [HumanMessage(content=t.content) if t.role == "user" else AIMessage(content=t.content) for t in history]
+
+@app.post("/query")
+async def query(req: QueryRequest) -> Dict[str, Any]:
+    """
+    Soruyu RAG chain veya agent ile cevaplar.
+
+    """
+    await asyncio.to_thread(_STATE.refresh)
+    t0 = time.perf_counter()
+    if req.mode == "agent":
+        result = await arun_agent(
+            _STATE.agents[req.is_short], req.question, _to_messages(req.chat_history),
+            is_short=req.is_short, model_name=_STATE.model_name,
+        )
+    else:
+        result = await aanswer_with_chain(_STATE.llm, _STATE.retriever, req.question, is_short=req.is_short)
+    return {
+        "answer": result["answer"],
+        "citations": result["citations"],
+        "sources": [d.metadata for d in result["docs"]],
+        "tokens": result["tokens"],
+        "cache": result.get("cache"),
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+@app.post("/ingest")
+async def ingest(req: IngestRequest) -> Dict[str, Any]:
+    """
+    UPLOAD_DIRECTORY'deki dosyaları (artımlı olarak) indeksler.
+
+    """
+    root = UPLOAD_DIRECTORY.resolve()
+    if req.paths:
+        paths = []
+        for name in req.paths:
+            path = (root / name).resolve()
+            if root not in path.parents or not path.is_file():
+                raise HTTPException(status_code=400, detail=f"Geçersiz dosya: {name}")
+            paths.append(path)
+    else:
+        paths = [p for p in root.iterdir() if p.suffix.lower() in ALLOWED_EXTS]
+
+    # Aynı worker içinde indekslemeler burada, worker'lar arasında index_files'ın dosya
+    # kilidinde sıraya girer; sorgular çalışmaya devam eder
+    async with _STATE.ingest_lock:
+        report = await asyncio.to_thread(index_files, paths)
+    await asyncio.to_thread(_STATE.refresh)
+    return {**report, "index_version": _STATE.index_version}
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    """
+    Servis durumu: indeks sürümü, chunk sayısı ve model metrikleri.
+
+    """
+    chunks = await asyncio.to_thread(_STATE.vectorstore._collection.count)
+    return {
+        "status": "ok",
+        "index_version": get_index_version(),
+        "chunks": chunks,
+        "llm_model": _STATE.model_name,
+        "search_type": SEARCH_TYPE,
+        "embeddings": get_embedding_stats(),
+        "uptime_seconds": round(time.time() - _STATE.started, 1),
+    }
+
+@app.get("/metrics")
+async def metrics(format: Literal["prometheus", "json"] = "prometheus") -> Any:
+    """
+    Aşama süreleri ve chunk/token sayılarının histogramları (p50/p95/p99).
+    Metrikler worker süreci başınadır; Prometheus her worker'ı ayrı örnekler.
+
+    """
+    if format == "json":
+        return snapshot()
+    return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
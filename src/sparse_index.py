@@ -0,0 +1,405 @@
+"""
+Sparse (BM25) indeks modülü - Anahtar kelime araması
+
+Bu modül şu görevleri yerine getirir:
+- Chunk metinlerini BM25 için token'lara ayırır (ürün kodu / sözleşme no. dostu)
+- Chroma koleksiyonuyla yan yana diskte kalıcı bir ters indeks (inverted index) tutar
+- Postings'i NumPy dizileri olarak saklar ve memory-map ile açar (anında başlangıç)
+- İndeksleme sırasında chunk ekleme/silme ile segment bazlı artımlı güncellenir
+- Sorgu için BM25 skorlarını vektörel NumPy ile hesaplar
+
+Disk düzeni (PERSIST_DIRECTORY/bm25):
+- manifest.json: aktif segmentlerin listesi
+- seg_NNNNNN/: terms.npy (sıralı terimler), offsets.npy (CSR ofsetleri),
+  postings.npy (doküman no.), tfs.npy (terim frekansı), doc_len.npy,
+  ids.npy (chunk id'leri), deleted.npy (silinmiş doküman maskesi)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from pathlib import Path
+import json
+import math
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+
+from config import PERSIST_DIRECTORY
+
+SPARSE_INDEX_DIR = PERSIST_DIRECTORY / "bm25"
+LEGACY_INDEX_FILE = PERSIST_DIRECTORY / "bm25_index.json"  # Eski tek dosyalı JSON biçimi
+MERGE_FACTOR = 4  # Aynı boyut seviyesinde bu kadar segment birikince birleştirilir
+MAX_TOKEN_LEN = 40  # Daha uzun token'lar (base64, URL vb.) terim dizisini şişirmesin
+
+# "ABC-123", "2024/15" gibi kodları hem bütün hem parça olarak indeksle
+_TOKEN_RE = re.compile(r"\w+(?:[-/.]\w+)*")
+_SPLIT_RE = re.compile(r"[-/.]")
+_ARRAYS = ("terms", "offsets", "postings", "tfs", "doc_len", "ids")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Metni BM25 token'larına ayırır (Türkçe büyük/küçük harf duyarlı).
+
+    """
+    text = text.replace("İ", "i").replace("I", "ı").lower()
+    tokens: List[str] = []
+    for tok in _TOKEN_RE.findall(text):
+        if len(tok) > MAX_TOKEN_LEN:
+            continue
+        tokens.append(tok)
+        if _SPLIT_RE.search(tok):
+            tokens.extend(p for p in _SPLIT_RE.split(tok) if p)
+    return tokens
+
+def _build_arrays(
+    terms: np.ndarray, term_idx: np.ndarray, doc_idx: np.ndarray, tfs: np.ndarray,
+    ids: np.ndarray, doc_len: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    (terim, doküman, tf) üçlülerinden CSR biçiminde segment dizileri üretir.
+
+    """
+    order = np.lexsort((doc_idx, term_idx))
+    counts = np.bincount(term_idx, minlength=len(terms))
+    used = counts > 0
+    offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+    np.cumsum(counts[used], out=offsets[1:])
+    return {
+        "terms": terms[used],
+        "offsets": offsets,
+        "postings": doc_idx[order].astype(np.int32),
+        "tfs": tfs[order].astype(np.float32),
+        "doc_len": doc_len.astype(np.float32),
+        "ids": ids,
+    }
+
+class _Segment:
+    """
+    Diskteki değişmez (immutable) bir postings segmenti; sadece silme maskesi değişir.
+
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.name = path.name
+        for name in _ARRAYS:
+            setattr(self, name, np.load(path / f"{name}.npy", mmap_mode="r"))
+        deleted_file = path / "deleted.npy"
+        self.deleted = np.load(deleted_file) if deleted_file.exists() else np.zeros(len(self.ids), dtype=bool)
+        self.dirty = False
+        self._update_stats()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _update_stats(self) -> None:
+        alive = ~self.deleted
+        self.alive_count = int(alive.sum())
+        self.alive_len = float(self.doc_len[alive].sum())
+
+    def delete(self, ids: np.ndarray) -> int:
+        hit = np.isin(self.ids, ids) & ~self.deleted
+        n = int(hit.sum())
+        if n:
+            self.deleted = self.deleted | hit
+            self.dirty = True
+            self._update_stats()
+        return n
+
+    def save_deleted(self) -> None:
+        if self.dirty:
+            tmp = self.path / "deleted.tmp.npy"
+            np.save(tmp, self.deleted)
+            os.replace(tmp, self.path / "deleted.npy")
+            self.dirty = False
+
+    def lookup(self, terms: np.ndarray) -> List[Tuple[int, int, int]]:
+        """
+        Sorgu terimleri için (sorgu terim no., başlangıç, bitiş) postings aralıklarını döndürür.
+
+        """
+        if len(self.terms) == 0:
+            return []
+        rows = np.searchsorted(self.terms, terms)
+        out = []
+        for qi, row in enumerate(rows):
+            if row < len(self.terms) and self.terms[row] == terms[qi]:
+                out.append((qi, int(self.offsets[row]), int(self.offsets[row + 1])))
+        return out
+
+    @staticmethod
+    def write(path: Path, arrays: Dict[str, np.ndarray]) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(path / f"{name}.npy", arrays[name])
+
+class BM25Index:
+    """
+    Chunk id'leri üzerinde diskte kalıcı, segment bazlı BM25 indeksi.
+
+    add/remove çağrıları bellekte biriktirilir ve save() ile yeni bir
+    segment olarak yazılır; benzer boyuttaki segmentler arka arkaya
+    birleştirilerek (LSM tarzı) segment sayısı logaritmik tutulur.
+    """
+
+    def __init__(self, path: Path = SPARSE_INDEX_DIR, k1: float = 1.5, b: float = 0.75) -> None:
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._segments: List[_Segment] = []
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._pending_deletes: set = set()
+        self._next_seg = 0
+        self._loaded_mtime: Optional[float] = None
+        self.load()
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.path / "manifest.json"
+
+    def __len__(self) -> int:
+        return sum(s.alive_count for s in self._segments)
+
+    def load(self) -> None:
+        """
+        Segmentleri diskten memory-map ile açar (dosya yoksa boş başlar).
+
+        """
+        with self._lock:
+            self._segments, self._pending, self._pending_deletes = [], {}, set()
+            self._next_seg, self._loaded_mtime = 0, None
+            if not self._manifest_path.exists():
+                self._migrate_legacy()
+                return
+            try:
+                with open(self._manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self._segments = [_Segment(self.path / name) for name in manifest["segments"]]
+                self._next_seg = manifest.get("next_segment", len(self._segments))
+                self._loaded_mtime = self._manifest_path.stat().st_mtime
+            except Exception:
+                self._segments = []
+
+    def _migrate_legacy(self) -> None:
+        """
+        Eski JSON biçimli indeksi (varsa) segment biçimine bir kez dönüştürür.
+
+        """
+        legacy = self.path.parent / LEGACY_INDEX_FILE.name
+        if not legacy.exists():
+            return
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                docs = json.load(f).get("docs", {})
+        except Exception:
+            return
+        self._pending = {doc_id: dict(tf) for doc_id, tf in docs.items()}
+        self.save()
+        legacy.unlink(missing_ok=True)
+
+    def refresh(self) -> None:
+        """
+        İndeks başka bir süreç tarafından değiştirildiyse / silindiyse yeniden yükler.
+
+        """
+        if self._pending or self._pending_deletes:
+            return  # Bu süreç yazıyor; kendi kaydedilmemiş değişikliklerini kaybetme
+        path = self._manifest_path
+        mtime = path.stat().st_mtime if path.exists() else None
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """
+        Chunk'ları indekse ekler; aynı id varsa save() sırasında eskisi silinir (upsert).
+
+        """
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                self._pending[doc_id] = dict(Counter(tokenize(text)))
+                self._pending_deletes.add(doc_id)
+
+    def remove(self, ids: List[str]) -> None:
+        """
+        Chunk'ları indeksten siler (save() ile kalıcı olur).
+
+        """
+        with self._lock:
+            for doc_id in ids:
+                self._pending.pop(doc_id, None)
+                self._pending_deletes.add(doc_id)
+
+    def save(self) -> None:
+        """
+        Bekleyen silmeleri uygular, yeni chunk'ları segment olarak yazar ve
+        gerekirse segmentleri birleştirir.
+
+        """
+        with self._lock:
+            if self._pending_deletes:
+                doomed = np.array([i.encode("utf-8") for i in self._pending_deletes])
+                for seg in self._segments:
+                    seg.delete(doomed)
+            if self._pending:
+                self._append_segment(self._build_pending())
+            self._pending, self._pending_deletes = {}, set()
+            self._compact()
+            self._write_manifest()
+
+    def optimize(self) -> None:
+        """
+        Tüm segmentleri tek bir segmentte birleştirir ve silinmiş dokümanları atar.
+
+        """
+        with self._lock:
+            self.save()
+            if len(self._segments) > 1 or any(s.alive_count < len(s) for s in self._segments):
+                self._merge(list(self._segments))
+                self._write_manifest()
+
+    def _build_pending(self) -> Dict[str, np.ndarray]:
+        ids = list(self._pending)
+        term_list: List[str] = []
+        doc_list: List[int] = []
+        tf_list: List[int] = []
+        doc_len = np.zeros(len(ids), dtype=np.float32)
+        for i, doc_id in enumerate(ids):
+            tf = self._pending[doc_id]
+            term_list.extend(tf.keys())
+            tf_list.extend(tf.values())
+            doc_list.extend([i] * len(tf))
+            doc_len[i] = sum(tf.values())
+        terms, term_idx = np.unique(np.array(term_list, dtype=str), return_inverse=True)
+        return _build_arrays(
+            terms, term_idx.ravel(), np.array(doc_list, dtype=np.int64), np.array(tf_list, dtype=np.float32),
+            np.array([i.encode("utf-8") for i in ids]), doc_len,
+        )
+
+    def _append_segment(self, arrays: Dict[str, np.ndarray]) -> _Segment:
+        name = f"seg_{self._next_seg:06d}"
+        self._next_seg += 1
+        _Segment.write(self.path / name, arrays)
+        seg = _Segment(self.path / name)
+        self._segments.append(seg)
+        return seg
+
+    def _merge(self, segments: List[_Segment]) -> None:
+        """
+        Verilen segmentleri silinmişleri atarak tek segmentte birleştirir (vektörel).
+
+        """
+        terms = np.unique(np.concatenate([np.asarray(s.terms) for s in segments]))
+        term_cols, doc_cols, tf_cols, id_cols, len_cols = [], [], [], [], []
+        base = 0
+        for s in segments:
+            alive = ~s.deleted
+            new_doc = np.cumsum(alive) - 1 + base
+            local_term = np.repeat(np.arange(len(s.terms)), np.diff(np.asarray(s.offsets)))
+            postings = np.asarray(s.postings)
+            keep = alive[postings]
+            term_cols.append(np.searchsorted(terms, np.asarray(s.terms))[local_term][keep])
+            doc_cols.append(new_doc[postings][keep])
+            tf_cols.append(np.asarray(s.tfs)[keep])
+            id_cols.append(np.asarray(s.ids)[alive])
+            len_cols.append(np.asarray(s.doc_len)[alive])
+            base += int(alive.sum())
+
+        doomed = set(id(s) for s in segments)
+        self._segments = [s for s in self._segments if id(s) not in doomed]
+        if base:
+            self._append_segment(_build_arrays(
+                terms, np.concatenate(term_cols), np.concatenate(doc_cols), np.concatenate(tf_cols),
+                np.concatenate(id_cols), np.concatenate(len_cols),
+            ))
+        for s in segments:
+            shutil.rmtree(s.path, ignore_errors=True)
+
+    def _compact(self) -> None:
+        """
+        Tamamen silinmiş segmentleri atar; aynı boyut seviyesinde MERGE_FACTOR
+        segment biriktiğinde onları birleştirir.
+
+        """
+        for s in [s for s in self._segments if s.alive_count == 0]:
+            self._segments.remove(s)
+            shutil.rmtree(s.path, ignore_errors=True)
+        while True:
+            levels: Dict[int, List[_Segment]] = {}
+            for s in self._segments:
+                level = int(math.log(max(s.alive_count, 1), MERGE_FACTOR))
+                levels.setdefault(level, []).append(s)
+            full = [segs for segs in levels.values() if len(segs) >= MERGE_FACTOR]
+            if not full:
+                break
+            self._merge(full[0])
+
+    def _write_manifest(self) -> None:
+        for s in self._segments:
+            s.save_deleted()
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / "manifest.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segments": [s.name for s in self._segments], "next_segment": self._next_seg}, f)
+        os.replace(tmp, self._manifest_path)
+        self._loaded_mtime = self._manifest_path.stat().st_mtime
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Sorgu için BM25 skoruna göre en iyi k chunk id'sini döndürür.
+
+        """
+        with self._lock:
+            segments = list(self._segments)
+        n_docs = sum(s.alive_count for s in segments)
+        q_terms = sorted(set(tokenize(query)))
+        if n_docs == 0 or not q_terms or k <= 0:
+            return []
+        q = np.array(q_terms, dtype=str)
+        avgdl = sum(s.alive_len for s in segments) / n_docs
+
+        # 1. geçiş: postings aralıkları ve (silinmişler hariç) df
+        ranges = [(s, s.lookup(q)) for s in segments]
+        df = np.zeros(len(q), dtype=np.float64)
+        for s, hits in ranges:
+            for qi, start, end in hits:
+                df[qi] += np.count_nonzero(~s.deleted[s.postings[start:end]])
+        idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+
+        # 2. geçiş: segment başına vektörel BM25 skorları
+        results: List[Tuple[str, float]] = []
+        for s, hits in ranges:
+            if not hits:
+                continue
+            scores = np.zeros(len(s), dtype=np.float32)
+            for qi, start, end in hits:
+                docs = s.postings[start:end]
+                tf = s.tfs[start:end]
+                norm = self.k1 * (1.0 - self.b + self.b * s.doc_len[docs] / avgdl)
+                scores[docs] += idf[qi] * tf * (self.k1 + 1.0) / (tf + norm)
+            scores[s.deleted] = 0.0
+            cand = np.flatnonzero(scores > 0)
+            if len(cand) > k:
+                cand = cand[np.argpartition(-scores[cand], k - 1)[:k]]
+            results.extend((s.ids[i].decode("utf-8"), float(scores[i])) for i in cand)
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results[:k]
+
+_INDEX_LOCK = threading.Lock()
+_INDEX: Optional[BM25Index] = None
+
+def get_sparse_index() -> BM25Index:
+    """
+    Süreç genelinde paylaşılan BM25 indeksini döndürür (gerekirse diskten tazeler).
+
+    """
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = BM25Index()
+        else:
+            _INDEX.refresh()
+        return _INDEX
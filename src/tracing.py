@@ -0,0 +1,227 @@
+"""
+İzleme modülü - Sorgu ve indeksleme yollarında aşama bazlı süre ölçümü
+
+Bu modül şu görevleri yerine getirir:
+- span() ile iç içe aşamaların (embed, arama, paketleme, LLM, yükleme, bölme...) sürelerini ölçer
+- Süreleri ve sayısal değerleri (chunk, token) süreç içi kayan histogramlarda tutar
+- Her kök işlem (chain, agent, ingest) bitince aşama özetini tek satır JSON log olarak yazar
+- Metrikleri Prometheus metin formatında dışa aktarır (/metrics)
+- TRACING_ENABLED=false iken span() paylaşılan no-op nesneyi döndürür (ihmal edilebilir maliyet)
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from contextvars import ContextVar
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from config import TRACING_ENABLED, TRACE_LOG_FILE, TRACE_WINDOW
+
+logger = logging.getLogger("docubrain.trace")
+
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "docubrain"
+
+class _Histogram:
+    """
+    Son `window` örneği tutan kayan histogram (toplam sayı/toplam ayrıca tutulur).
+
+    """
+    __slots__ = ("samples", "count", "sum")
+
+    def __init__(self, window: int) -> None:
+        self.samples: deque = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self, qs=QUANTILES) -> List[Optional[float]]:
+        if not self.samples:
+            return [None] * len(qs)
+        ordered = sorted(self.samples)
+        return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in qs]
+
+_LOCK = threading.Lock()
+# (metrik, aşama) -> histogram. Süreler "seconds" metriğinde, sayısal span değerleri kendi adıyla
+_REGISTRY: Dict[Tuple[str, str], _Histogram] = {}
+
+def observe(metric: str, stage: str, value: float) -> None:
+    """
+    Bir aşama için sayısal değeri histograma ekler.
+
+    """
+    if not TRACING_ENABLED:
+        return
+    with _LOCK:
+        hist = _REGISTRY.get((metric, stage))
+        if hist is None:
+            hist = _REGISTRY[(metric, stage)] = _Histogram(TRACE_WINDOW)
+        hist.observe(float(value))
+
+def _numeric(attrs: Dict[str, Any]) -> Dict[str, float]:
+    return {k: v for k, v in attrs.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+class Span:
+    """
+    Bir aşamanın süresini ölçer. Kök span alt aşamaları isme göre toplar
+    (sayı, toplam süre, sayısal değerlerin toplamı) ve bitince JSON log yazar.
+
+    """
+    __slots__ = ("name", "attrs", "parent", "root", "stages", "start", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.parent: Optional[Span] = None
+        self.root: Optional[Span] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.start = 0.0
+        self._token = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def __enter__(self) -> "Span":
+        parent = self.parent = _CURRENT.get()
+        self.root = parent.root or parent if parent is not None else None
+        self._token = _CURRENT.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        try:
+            _CURRENT.reset(self._token)
+        except ValueError:  # Generator başka bir context'te kapatıldı
+            _CURRENT.set(self.parent)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _finish(self, duration)
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+_NOOP = _NoopSpan()
+_CURRENT: ContextVar[Optional[Span]] = ContextVar("docubrain_span", default=None)
+
+def span(name: str, **attrs: Any):
+    """
+    Aşama ölçümü için context manager: `with span("chain.retrieve") as sp: ...; sp.set(chunks=n)`.
+    Sayısal değerler (chunk, token) aşama adıyla histograma yazılır.
+
+    """
+    if not TRACING_ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+def record_stage(name: str, seconds: float, **attrs: Any) -> None:
+    """
+    Başka yerde ölçülmüş bir aşamayı (ör. worker process'teki yükleme) mevcut
+    span'in altına kaydeder.
+
+    """
+    if not TRACING_ENABLED:
+        return
+    s = Span(name, attrs)
+    parent = _CURRENT.get()
+    s.root = parent.root or parent if parent is not None else None
+    _finish(s, seconds)
+
+def _finish(s: Span, duration: float) -> None:
+    observe("seconds", s.name, duration)
+    numeric = _numeric(s.attrs)
+    for key, value in numeric.items():
+        observe(key, s.name, value)
+
+    if s.root is not None:
+        agg = s.root.stages.setdefault(s.name, {"count": 0, "ms": 0.0})
+        agg["count"] += 1
+        agg["ms"] += duration * 1000
+        for key, value in numeric.items():
+            agg[key] = agg.get(key, 0) + value
+        return
+    _emit({
+        "ts": time.time(),
+        "span": s.name,
+        "ms": round(duration * 1000, 2),
+        **s.attrs,
+        "stages": {k: {**v, "ms": round(v["ms"], 2)} for k, v in s.stages.items()},
+    })
+
+def _emit(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    logger.info(line)
+    if TRACE_LOG_FILE:
+        try:
+            TRACE_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(TRACE_LOG_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0))
+            try:
+                os.write(fd, (line + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+        except OSError:
+            pass  # İzleme hiçbir zaman sorguyu düşürmemeli
+
+def snapshot() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    {metrik: {aşama: {"count", "sum", "p50", "p95", "p99"}}} döndürür (son TRACE_WINDOW örnek).
+
+    """
+    with _LOCK:
+        items = [(k, h.count, h.sum, h.quantiles()) for k, h in _REGISTRY.items()]
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (metric, stage), count, total, qs in sorted(items):
+        out.setdefault(metric, {})[stage] = {
+            "count": count, "sum": round(total, 6),
+            **{f"p{int(q * 100)}": (round(v, 6) if v is not None else None) for q, v in zip(QUANTILES, qs)},
+        }
+    return out
+
+def _metric_name(metric: str) -> str:
+    return f"{METRIC_PREFIX}_stage_" + re.sub(r"[^a-zA-Z0-9_]", "_", metric)
+
+def prometheus_text() -> str:
+    """
+    Histogramları Prometheus metin formatında (summary) döndürür.
+
+    """
+    lines: List[str] = []
+    for metric, stages in snapshot().items():
+        name = _metric_name(metric)
+        lines.append(f"# TYPE {name} summary")
+        for stage, s in stages.items():
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            for q in QUANTILES:
+                value = s[f"p{int(q * 100)}"]
+                if value is not None:
+                    lines.append(f'{name}{{stage="{label}",quantile="{q}"}} {value}')
+            lines.append(f'{name}_sum{{stage="{label}"}} {s["sum"]}')
+            lines.append(f'{name}_count{{stage="{label}"}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    with _LOCK:
+        _REGISTRY.clear()
@@ -0,0 +1,26 @@
+"""
+Test ortamı - src modülleri import edilmeden önce tüm storage yollarını geçici bir dizine
+yönlendirir ve ağ gerektirmeyen sahte embedding modelini / LLM'i seçer.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+_STORAGE = Path(tempfile.mkdtemp(prefix="docubrain-test-"))
+
+os.environ.update({
+    "PERSIST_DIRECTORY": str(_STORAGE / "chroma_db"),
+    "UPLOAD_DIRECTORY": str(_STORAGE / "uploads"),
+    "EMBEDDING_CACHE_DIR": str(_STORAGE / "embedding_cache"),
+    "ANSWER_CACHE_FILE": str(_STORAGE / "answer_cache.sqlite"),
+    "CHAT_HISTORY_DIR": str(_STORAGE / "chat_history"),
+    "EMBEDDING_MODEL_NAME": "fake",
+    "LLM_PROVIDER": "fake",
+    "QUERY_BATCH_WINDOW_MS": "0",
+    "ANONYMIZED_TELEMETRY": "False",
+})
+os.environ.pop("TRACE_LOG_FILE", None)
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
@@ -0,0 +1,62 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent
+import ingest
+from answer_cache import get_answer_cache
+from corpus import write_docx
+from llm_clients import FakeChatModel
+from rag_chain import answer_with_chain, build_retriever, retrieval_signature
+from test_dedup import CONTRACT
+
+@pytest.fixture(scope="module")
+def vectorstore(tmp_path_factory):
+    ingest.reset_vectorstore()
+    path = tmp_path_factory.mktemp("docs") / "sozlesme.docx"
+    write_docx(path, [CONTRACT.format(amount=str(100000 + i)) for i in range(6)])
+    ingest.index_files([path])
+    get_answer_cache().clear()
+    return ingest.get_vectorstore()
+
+class _Executor:
+    """Her çağrıda farklı cevap veren agent yerine geçen nesne."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, state):
+        self.calls += 1
+        return {"messages": state["messages"] + [AIMessage(content=f"cevap {self.calls}")]}
+
+def test_chain_cache_is_scoped_to_retrieval_settings(vectorstore):
+    llm = FakeChatModel()
+    similarity = build_retriever(vectorstore, "similarity", 2, cache=False)
+    mmr = build_retriever(vectorstore, "mmr", 4, cache=False)
+    assert retrieval_signature(similarity) != retrieval_signature(mmr)
+
+    question = "Toplam bedel ne kadar?"
+    assert answer_with_chain(llm, similarity, question)["cache"]["hit"] is False
+    assert answer_with_chain(llm, similarity, question)["cache"]["hit"] is True
+    assert answer_with_chain(llm, mmr, question)["cache"]["hit"] is False
+
+def test_agent_follow_ups_bypass_cache(vectorstore):
+    executor = _Executor()
+    assert agent.run_agent(executor, "Toplam bedel nedir?", [])["answer"] == "cevap 1"
+    assert agent.run_agent(executor, "Toplam bedel nedir?", [])["cache"]["hit"] is True
+
+    history = [HumanMessage(content="Sözleşmeleri listele"), AIMessage(content="İki sözleşme var.")]
+    first = agent.run_agent(executor, "peki ya ikincisi?", history)
+    second = agent.run_agent(executor, "peki ya ikincisi?", [HumanMessage(content="Faturaları listele")])
+    assert first["cache"] is None and second["cache"] is None
+    assert executor.calls == 3
+
+def test_agent_cache_is_scoped_to_retrieval_settings(vectorstore):
+    llm = FakeChatModel()
+    similarity = agent.build_agent(llm, build_retriever(vectorstore, "similarity", 2, cache=False))
+    mmr = agent.build_agent(llm, build_retriever(vectorstore, "mmr", 4, cache=False))
+
+    question = "Ödeme vadesi nedir?"
+    assert agent.run_agent(similarity, question, [])["cache"]["hit"] is False
+    assert agent.run_agent(similarity, question, [])["cache"]["hit"] is True
+    # Aynı indeks sürümünde arama ayarı değişince eski agent cevabı kullanılmaz
+    assert agent.run_agent(mmr, question, [])["cache"]["hit"] is False
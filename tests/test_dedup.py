@@ -0,0 +1,44 @@
+from dedup import DedupIndex, content_hash
+
+CONTRACT = (
+    "Bu sozlesme kapsaminda tedarikci tarafindan teslim edilecek hizmetlerin toplam bedeli "
+    "{amount} TL olarak belirlenmistir ve odeme takvimi ek bir protokol ile duzenlenecektir. "
+    "Taraflar teslim tarihlerine uymakla yukumlu olup gecikme halinde cezai sart uygulanir "
+    "ve fatura bedeli ilgili birim yoneticisinin onayindan sonra otuz gun icinde odenir."
+)
+
+def _add(index, text, source):
+    match, fingerprint = index.match(text)
+    assert match is None
+    index.add(content_hash(text), fingerprint, (source, None, 0, "v1"))
+    return content_hash(text)
+
+def test_near_duplicates_are_not_merged_by_default(tmp_path):
+    index = DedupIndex(path=tmp_path / "dedup.json")
+    _add(index, CONTRACT.format(amount="150000"), "a.docx")
+    match, _ = index.match(CONTRACT.format(amount="275000"))
+    assert match is None
+
+def test_exact_duplicates_always_merge(tmp_path):
+    index = DedupIndex(path=tmp_path / "dedup.json")
+    chunk_id = _add(index, CONTRACT.format(amount="150000"), "a.docx")
+    match, _ = index.match("  " + CONTRACT.format(amount="150000").upper())
+    assert match == chunk_id
+
+def test_released_entries_only_match_exactly(tmp_path):
+    index = DedupIndex(path=tmp_path / "dedup.json", enabled=True)
+    chunk_id = _add(index, CONTRACT.format(amount="150000"), "a.docx")
+    index.release_source("a.docx")
+
+    # Düzenlenen dosyanın yeni metni eski sürümüne bağlanmamalı
+    match, _ = index.match(CONTRACT.format(amount="275000"))
+    assert match is None
+    # Değişmeyen metin eski chunk'ı yeniden kullanır
+    match, _ = index.match(CONTRACT.format(amount="150000"))
+    assert match == chunk_id
+
+def test_opt_in_near_duplicates_merge_with_live_entries(tmp_path):
+    index = DedupIndex(path=tmp_path / "dedup.json", enabled=True)
+    chunk_id = _add(index, CONTRACT.format(amount="150000"), "a.docx")
+    match, _ = index.match(CONTRACT.format(amount="150001"))
+    assert match == chunk_id
@@ -0,0 +1,24 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from embeddings import _QueryBatcher
+
+def _embed(texts):
+    time.sleep(0.02)  # Model forward pass
+    return [[float(len(t))] for t in texts]
+
+def test_single_query_does_not_wait_for_window():
+    batcher = _QueryBatcher(_embed, window_ms=300, max_size=16)
+    for text in ("izin", "mesai", "prim"):
+        t0 = time.perf_counter()
+        assert batcher.submit(text) == [float(len(text))]
+        assert time.perf_counter() - t0 < 0.2
+    assert batcher.stats["batches"] == 3
+
+def test_concurrent_queries_share_batches():
+    batcher = _QueryBatcher(_embed, window_ms=20, max_size=16)
+    texts = [f"soru {i}" for i in range(16)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        vectors = list(pool.map(batcher.submit, texts))
+    assert vectors == [[float(len(t))] for t in texts]
+    assert batcher.stats["batches"] < len(texts)
@@ -0,0 +1,80 @@
+from functools import partial
+import threading
+
+import pytest
+from filelock import FileLock
+
+import ingest
+from corpus import write_docx
+from dedup import DedupIndex, content_hash
+from test_dedup import CONTRACT
+
+@pytest.fixture
+def contract(tmp_path):
+    ingest.reset_vectorstore()
+    path = tmp_path / "sozlesme.docx"
+    write_docx(path, [CONTRACT.format(amount="150000")])
+    return path
+
+def _stored_texts(path):
+    ids = ingest.load_manifest()[str(path)]["chunk_ids"]
+    return ingest.get_vectorstore().get(ids=ids, include=["documents"])["documents"]
+
+@pytest.mark.parametrize("near_dup", [False, True])
+def test_edited_document_is_reindexed(contract, monkeypatch, near_dup):
+    monkeypatch.setattr(ingest, "DedupIndex", partial(DedupIndex, enabled=near_dup))
+    ingest.index_files([contract])
+    assert any("150000" in t for t in _stored_texts(contract))
+
+    write_docx(contract, [CONTRACT.format(amount="275000")])
+    stats = ingest.index_files([contract])
+
+    assert stats["updated"] == 1
+    texts = _stored_texts(contract)
+    assert any("275000" in t for t in texts)
+    assert not any("150000" in t for t in texts)
+
+def test_edit_replaces_only_changed_chunk_ids(tmp_path):
+    ingest.reset_vectorstore()
+    path = tmp_path / "ek_protokol.docx"
+    amounts = [str(110000 + 10000 * i) for i in range(8)]
+    write_docx(path, [CONTRACT.format(amount=a) for a in amounts])
+    ingest.index_files([path])
+    before = set(ingest.load_manifest()[str(path)]["chunk_ids"])
+    assert len(before) > 1
+
+    amounts[2] = "999999"
+    write_docx(path, [CONTRACT.format(amount=a) for a in amounts])
+    written = []
+    ingest.index_files([path], progress_callback=lambda p: written.append(p["chunks_done"]))
+    after = set(ingest.load_manifest()[str(path)]["chunk_ids"])
+
+    vs = ingest.get_vectorstore()
+    # Değişmeyen chunk'lar aynı id ile kalır, sadece değişenler yeniden embed edilip yazılır
+    assert before & after
+    assert 0 < written[-1] == len(after - before) < len(after)
+    # Eski sürümün vektörü kalmaz; yeni id'ler yeni içeriğin özetidir
+    assert vs.get(ids=sorted(before - after))["ids"] == []
+    got = vs.get(ids=sorted(after), include=["documents"])
+    assert sorted(got["ids"]) == sorted(after)
+    for chunk_id, text in zip(got["ids"], got["documents"]):
+        assert chunk_id == content_hash(text)
+    assert any("999999" in t for t in got["documents"])
+    assert vs._collection.count() == len(after)
+
+def test_index_files_waits_for_another_writer(contract):
+    # Başka bir süreçteki /ingest kilidi tutarken indeksleme başlamaz
+    holder = FileLock(str(ingest.INGEST_LOCK_FILE))
+    holder.acquire()
+    done = threading.Event()
+    worker = threading.Thread(target=lambda: (ingest.index_files([contract]), done.set()))
+    worker.start()
+    try:
+        assert not done.wait(0.5)
+        assert str(contract) not in ingest.load_manifest()
+    finally:
+        holder.release()
+    worker.join(60)
+    assert done.is_set()
+    assert any("150000" in t for t in _stored_texts(contract))
+    assert ingest.INGEST_LOCK_FILE.exists()
@@ -0,0 +1,40 @@
+import asyncio
+
+import httpx
+
+import llm_clients
+
+COMPLETION = {
+    "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "14 gün"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+}
+
+def test_llm_built_outside_loop_uses_running_loops_pool(monkeypatch):
+    used = []
+
+    def pooled_client():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=COMPLETION)))
+        used.append((asyncio.get_running_loop(), client))
+        return client
+
+    monkeypatch.setattr(llm_clients, "get_async_http_client", pooled_client)
+    monkeypatch.setattr(llm_clients, "LLM_PROVIDER", "openai")
+    # Servis / Streamlit gibi: LLM çalışan bir loop yokken oluşturulur
+    llm = llm_clients.create_llm("gpt-4o-mini", api_key="test", max_retries=0)
+
+    async def ask():
+        return (await llm.ainvoke("Yıllık izin kaç gün?")).content
+
+    assert asyncio.run(ask()) == "14 gün"
+    assert asyncio.run(ask()) == "14 gün"
+    assert len(used) == 2 and used[0][0] is not used[1][0]  # Her çağrı kendi loop'unun havuzunda
+
+def test_pool_is_shared_per_loop():
+    async def clients():
+        return llm_clients.get_async_http_client(), llm_clients.get_async_http_client()
+
+    first, again = asyncio.run(clients())
+    other, _ = asyncio.run(clients())
+    assert first is again
+    assert first is not other
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+
+import ingest
+import server
+from conftest import ROOT
+from rag_chain import bump_index_version
+from test_dedup import CONTRACT
+
+_INGEST_SCRIPT = """
+import sys
+from pathlib import Path
+sys.path[:0] = ["src", "benchmarks"]
+from corpus import write_docx
+import ingest
+path = Path(sys.argv[1])
+write_docx(path, [sys.argv[2]])
+ingest.index_files([path])
+"""
+
+@pytest.fixture(scope="module")
+def state():
+    server._STATE.build()
+    return server._STATE
+
+def test_refresh_runs_off_the_event_loop_once(state, monkeypatch):
+    rebuild = state._build_retrievers
+    calls = []
+
+    def slow_rebuild(reload):
+        calls.append(threading.current_thread())
+        time.sleep(0.5)
+        rebuild(reload)
+
+    monkeypatch.setattr(state, "_build_retrievers", slow_rebuild)
+    bump_index_version()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            queries = [
+                asyncio.create_task(client.post("/query", json={"question": f"Toplam bedel? {i}"}))
+                for i in range(4)
+            ]
+            await asyncio.sleep(0.05)
+            t0 = time.perf_counter()
+            metrics = await client.get("/metrics", params={"format": "json"})
+            blocked = time.perf_counter() - t0
+            responses = await asyncio.gather(*queries)
+        return metrics, blocked, responses
+
+    metrics, blocked, responses = asyncio.run(scenario())
+    assert metrics.status_code == 200
+    # Yeniden kurulum sürerken diğer istekler event loop'ta beklemez
+    assert blocked < 0.3
+    assert all(r.status_code == 200 for r in responses)
+    assert len(calls) == 1
+    assert calls[0] is not threading.main_thread()
+
+def test_refresh_sees_chunks_ingested_by_another_worker(state, tmp_path):
+    text = CONTRACT.format(amount="424242")
+    state.vectorstore.similarity_search(text, k=1)  # HNSW indeksi bu süreçte yüklü olsun
+    path = tmp_path / "baska_worker.docx"
+    subprocess.run(
+        [sys.executable, "-c", _INGEST_SCRIPT, str(path), text],
+        cwd=ROOT, env=os.environ, check=True, timeout=120,
+    )
+    new_ids = set(ingest.load_manifest()[str(path)]["chunk_ids"])
+    total = state.vectorstore._collection.count()
+
+    stale = {d.id for d in state.vectorstore.similarity_search(text, k=total)}
+    assert not new_ids & stale  # Chroma başka sürecin eklediği vektörleri aramada görmez
+
+    state.refresh()
+    found = {d.id for d in state.vectorstore.similarity_search(text, k=total)}
+    assert new_ids <= found
+    found = {d.id for d in state.retriever.invoke(text)}
+    assert new_ids & found